@@ -0,0 +1,108 @@
+from ScheduleCache import load_scheduling_data, INPUT_FILES
+import argparse
+import contextlib
+import csv
+import gc
+import io
+import math
+import os.path
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+import types
+
+# Measures the memory retained by the loaded scheduling data at several cadet
+# counts, against the dict-backed classes of a baseline revision read from git
+
+
+def write_scaled_inputs(data_directory, output_directory, number_cadets):
+    """
+    Writes the inputs with Cadets.csv and Demand.csv cloned until there are at
+    least number_cadets cadets; each clone gets a suffixed Cadet PID
+    Returns the number of cadets written
+    """
+    for file_name in INPUT_FILES:
+        if file_name not in ("Cadets.csv", "Demand.csv"):
+            shutil.copy(os.path.join(data_directory, file_name), os.path.join(output_directory, file_name))
+
+    number_written = 0
+    for file_name in ("Cadets.csv", "Demand.csv"):
+        with open(os.path.join(data_directory, file_name), newline='') as input_file:
+            rows = list(csv.reader(input_file))
+        header, rows = rows[0], rows[1:]
+        if file_name == "Cadets.csv":
+            copies = max(1, math.ceil(number_cadets / len(rows)))
+            number_written = copies * len(rows)
+        with open(os.path.join(output_directory, file_name), 'w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(header)
+            for copy in range(copies):
+                for row in rows:
+                    writer.writerow([row[0] if copy == 0 else "{}-{}".format(row[0], copy)] + row[1:])
+    return number_written
+
+
+def load_baseline_module(revision, directory):
+    """Returns the SchedulingData module of the given git revision as a temporary module"""
+    if revision is None:
+        revision = subprocess.run(["git", "rev-list", "--max-parents=0", "HEAD"], cwd=directory,
+                                  capture_output=True, text=True, check=True).stdout.split()[0]
+    source = subprocess.run(["git", "show", revision + ":./SchedulingData.py"], cwd=directory,
+                            capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType("BaselineSchedulingData")
+    exec(compile(source, revision + ":SchedulingData.py", "exec"), module.__dict__)
+    return revision, module
+
+
+def load_baseline_data(module, data_directory):
+    """Loads the inputs with the baseline classes, in the order the baseline RunSchedule used"""
+    schedule_data = module.SchedulingData(3, 8)
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule_data.input_course_data(os.path.join(data_directory, "Courses.csv"))
+        schedule_data.input_student_data(os.path.join(data_directory, "Cadets.csv"))
+        schedule_data.input_sport_data(os.path.join(data_directory, "Sports.csv"))
+        schedule_data.input_pco(os.path.join(data_directory, "PCO.csv"))
+        schedule_data.input_student_demand(os.path.join(data_directory, "Demand.csv"))
+        schedule_data.add_pe_courses()
+        schedule_data.add_armnshp_courses()
+    return schedule_data
+
+
+def measure(function):
+    """Returns (result, bytes retained by the result) of calling function"""
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory of the compact and the baseline data model")
+    parser.add_argument("--cadets", type=int, nargs="+", default=[5000, 50000], help="cadet counts to measure")
+    parser.add_argument("--baseline", default=None,
+                        help="git revision whose SchedulingData.py is measured (default: the root commit)")
+    args = parser.parse_args()
+
+    current_directory = os.path.dirname(os.path.abspath(__file__))
+    data_directory = os.path.join(current_directory, "..")
+    revision, baseline_module = load_baseline_module(args.baseline, current_directory)
+    print("Baseline classes from {}".format(revision))
+    print("{:>8} {:>10} {:>10} {:>14} {:>14} {:>10}".format(
+        "cadets", "requests", "baseline", "compact (MB)", "baseline (MB)", "saved"))
+    for number_cadets in args.cadets:
+        with tempfile.TemporaryDirectory() as output_directory:
+            number_written = write_scaled_inputs(data_directory, output_directory, number_cadets)
+            schedule_data, compact = measure(lambda: load_scheduling_data(output_directory))
+            baseline_data, dict_backed = measure(lambda: load_baseline_data(baseline_module, output_directory))
+        print("{:>8} {:>10} {:>10} {:>14.1f} {:>14.1f} {:>9.0%}".format(
+            number_written, len(schedule_data.course_requests), len(baseline_data.unscheduled_course_requests),
+            compact / 1e6, dict_backed / 1e6, 1 - compact / dict_backed))
+        del schedule_data, baseline_data
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,145 @@
-from SchedulingData import SchedulingData
-from SchedulingAlgorithm import ScheduleCourses
+from SchedulingAlgorithm import ScheduleCourses, MultiStartScheduler, PartitionedScheduler, ScheduleRepair
+from ScheduleCache import load_scheduling_data, hash_input_files, INPUT_FILES, PREREQUISITE_FILE
+from ScheduleCheckpoint import ScheduleCheckpoint
+from ScheduleMetrics import ScheduleMetrics, phase_timer
+from ScheduleReports import ScheduleReports
+from ScheduleDatabase import export_schedule_database
+from SchedulingData import PeriodGrid
+import argparse
+import os
 import os.path
-# TODO: Create a counter to compare requests to offerings - make sure enough offerings for requests
-# TODO: Create report to report class rosters
-# TODO: Create report for semester/period/class/(#enrolled/available)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Schedule an academic year of course requests")
+    parser.add_argument("--engine", choices=["greedy", "flow"], default="greedy",
+                        help="greedy priority matcher or per-course min-cost flow")
+    parser.add_argument("--seed", type=int, default=None, help="seed for a reproducible greedy run")
+    parser.add_argument("--runs", type=int, default=1, help="number of seeded greedy runs to pick the best from")
+    parser.add_argument("--time-budget", type=float, default=None, help="seconds allowed for multi-start runs")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes for multi-start and partitioned runs")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="schedule this many groups of students concurrently and merge them")
+    parser.add_argument("--repair-time", type=float, default=None,
+                        help="seconds of local-search repair after scheduling, 0 to skip; "
+                             "defaults to 10, or 0 with --warm-start since repair moves kept courses")
+    parser.add_argument("--warm-start", default=None,
+                        help="prior schedule CSV to keep, only new and displaced requests are scheduled")
+    parser.add_argument("--no-cache", action="store_true", help="always re-read the CSV inputs")
+    parser.add_argument("--periods", type=int, default=8, help="periods per block cycle, split over M and T days")
+    parser.add_argument("--semester", default=None,
+                        help="schedule only this semester, e.g. Fall, with the requests --warm-start places in it")
+    parser.add_argument("--checkpoint", default=None,
+                        help="save the greedy or multi-start state to this file while scheduling")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0, help="seconds between greedy checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the --checkpoint file instead of starting over")
+    parser.add_argument("--reports", default=None,
+                        help="write class rosters, offering fill, the fill matrix, unscheduled requests and "
+                             "department summary CSVs to this folder")
+    parser.add_argument("--database", default=None,
+                        help="also write the schedule to this SQLite database for indexed lookups")
+    parser.add_argument("--metrics", default=None, help="write phase timers, counters and fill rates to this JSON file")
+    parser.add_argument("--profile", action="store_true", help="include a cProfile summary of scheduling in the metrics")
+    args = parser.parse_args()
+    if args.checkpoint is not None and (args.engine == "flow" or args.partitions is not None):
+        parser.error("--checkpoint supports greedy and multi-start runs")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume needs --checkpoint")
+    if args.semester is not None and args.warm_start is None:
+        parser.error("--semester needs --warm-start, the schedule that places requests in the semester")
+    metrics = ScheduleMetrics() if args.metrics is not None else None
+    period_grid = PeriodGrid.from_sizes(3, args.periods)
+    if args.semester is not None:
+        try:
+            period_grid = period_grid.single_semester(args.semester)
+        except ValueError as error:
+            parser.error(str(error))
+
     print("Loading Data")
     current_directory = os.path.dirname(__file__)
-    schedule_data = SchedulingData(3, 8)
-    schedule_data.input_course_data(current_directory + "/../Courses.csv")
-    schedule_data.input_student_data(current_directory + "/../Cadets.csv")
-    schedule_data.input_sport_data(current_directory + "/../Sports.csv")
-    schedule_data.input_pco(current_directory + "/../PCO.csv")
-    schedule_data.input_student_demand(current_directory + "/../Demand.csv")
-    schedule_data.add_pe_courses()
-    schedule_data.add_armnshp_courses()
+    schedule_data = load_scheduling_data(current_directory + "/..",
+                                         None if args.no_cache else current_directory + "/../.schedule_cache",
+                                         period_grid, metrics, None if args.semester is None else args.warm_start)
+    try:
+        schedule_data.check_grid_demand()
+    except ValueError as error:
+        parser.error(str(error))
     print("Read in {} course requests".format(len(schedule_data.unscheduled_course_requests)))
+    if args.warm_start is not None:
+        with phase_timer(metrics, "input_prior_schedule"):
+            schedule_data.input_prior_schedule(args.warm_start)
+    repair_time = args.repair_time
+    if repair_time is None:
+        repair_time = 0 if args.warm_start is not None else 10.0
+
+    checkpoint = None
+    if args.checkpoint is not None:
+        # a checkpoint is only resumed by a run with the same inputs and settings
+        input_files = [os.path.join(current_directory, "..", file_name)
+                       for file_name in INPUT_FILES + [PREREQUISITE_FILE]]
+        input_files = [file_name for file_name in input_files if os.path.exists(file_name)]
+        if args.warm_start is not None:
+            input_files.append(args.warm_start)
+        key = "{},{},{}".format(hash_input_files(input_files, period_grid), args.seed, args.runs)
+        if args.runs > 1:
+            fields = MultiStartScheduler.get_checkpoint_fields(schedule_data, args.runs)
+        else:
+            fields = ScheduleCourses.get_checkpoint_fields(schedule_data)
+        if not args.resume and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+        checkpoint = ScheduleCheckpoint(args.checkpoint, fields, key)
     # schedule_data.print_unscheduled_report()
 
-    scheduler = ScheduleCourses(schedule_data)
-    scheduler.match_courses_greedy_algorithm()
+    with phase_timer(metrics, "schedule", args.profile):
+        if args.engine == "flow":
+            scheduler = ScheduleCourses(schedule_data, args.seed, metrics=metrics)
+            scheduler.match_courses_min_cost_flow()
+        elif args.partitions is not None:
+            scheduler = PartitionedScheduler(schedule_data, args.partitions, args.processes, args.seed,
+                                             metrics=metrics)
+            scheduler.match_courses_partitioned()
+        elif args.runs > 1:
+            scheduler = MultiStartScheduler(schedule_data, args.runs, args.time_budget, args.processes,
+                                            0 if args.seed is None else args.seed, checkpoint)
+            scheduler.match_courses_multi_start()
+        else:
+            scheduler = ScheduleCourses(schedule_data, args.seed, metrics=metrics, checkpoint=checkpoint,
+                                        checkpoint_interval=args.checkpoint_interval)
+            state = None if checkpoint is None else checkpoint.load()
+            if state is not None:
+                scheduler.resume_from_checkpoint(state)
+                print("Resumed from the checkpoint with {} course requests left to schedule".format(
+                    len(scheduler.unscheduled_priority_queue)))
+            scheduler.match_courses_greedy_algorithm()
+    if repair_time > 0:
+        with phase_timer(metrics, "repair_conflicts"):
+            scheduler.schedule_conflict = ScheduleRepair(schedule_data, repair_time).repair_conflicts(
+                scheduler.schedule_conflict)
     print("Scheduler Complete")
     print("--------------Unscheduled Courses--------------")
     #schedule_data.print_unscheduled_report()
     print("--------------Student Schedules----------------")
-    schedule_data.student_lookup.output_student_schedules("Schedule Data.csv")
+    with phase_timer(metrics, "output_student_schedules"):
+        schedule_data.student_lookup.output_student_schedules("Schedule Data.csv")
     schedule_data.student_lookup.print_student_schedule(next(iter(schedule_data.student_lookup.students)))
+    reports = None
+    if args.reports is not None:
+        with phase_timer(metrics, "write_reports"):
+            reports = ScheduleReports(schedule_data)
+            reports.write(args.reports)
+        print("Reports written to", args.reports)
+    if args.database is not None:
+        with phase_timer(metrics, "export_schedule_database"):
+            export_schedule_database(schedule_data, args.database, reports)
+        print("Schedule database written to", args.database)
     #schedule_data.student_lookup.print_all_schedules(1)
+    if metrics is not None:
+        metrics.count("unscheduled after repair", len(scheduler.schedule_conflict))
+        metrics.write_report(args.metrics)
+        print("Metrics written to", args.metrics)
+
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from SchedulingData import SchedulingData
+from SchedulingAlgorithm import ScheduleCourses
+from SyntheticData import SyntheticData, SCALES
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os.path
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+# Times each scheduling phase on synthetic inputs and compares the results
+# with a stored baseline; exits with status 1 when a phase regresses
+
+PHASES = ["input_course_data", "input_student_data", "input_sport_data", "input_pco", "input_student_demand",
+          "input_expansion_rules", "expand_course_requests", "create_unscheduled_priority_queue",
+          "match_courses_greedy_algorithm", "output_student_schedules"]
+
+
+def run_phases(data_directory, seed):
+    """
+    Loads and schedules the inputs in data_directory one phase at a time
+    Runs in a fresh process so the peak resident memory belongs to this run only
+    """
+    timings = {}
+
+    def timed(phase, function, *args):
+        start = time.perf_counter()
+        function(*args)
+        timings[phase] = time.perf_counter() - start
+
+    # the loaders print progress; keep the benchmark output to the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule_data = SchedulingData(3, 8)
+        timed("input_course_data", schedule_data.input_course_data, os.path.join(data_directory, "Courses.csv"))
+        timed("input_student_data", schedule_data.input_student_data, os.path.join(data_directory, "Cadets.csv"))
+        timed("input_sport_data", schedule_data.input_sport_data, os.path.join(data_directory, "Sports.csv"))
+        timed("input_pco", schedule_data.input_pco, os.path.join(data_directory, "PCO.csv"))
+        timed("input_student_demand", schedule_data.input_student_demand, os.path.join(data_directory, "Demand.csv"))
+        timed("input_expansion_rules", schedule_data.input_expansion_rules,
+              os.path.join(data_directory, "Expansion Rules.csv"))
+        timed("expand_course_requests", schedule_data.expand_course_requests)
+        scheduler = ScheduleCourses(schedule_data, seed, verbose=False)
+        number_requests = len(schedule_data.course_requests)
+        timed("create_unscheduled_priority_queue", scheduler.create_unscheduled_priority_queue)
+        timed("match_courses_greedy_algorithm", scheduler.match_courses_greedy_algorithm)
+        with tempfile.TemporaryDirectory() as output_directory:
+            timed("output_student_schedules", schedule_data.student_lookup.output_student_schedules,
+                  os.path.join(output_directory, "Schedule Data.csv"))
+
+    return {'requests': number_requests, 'conflicts': len(scheduler.schedule_conflict),
+            'peak_rss_mb': round(get_peak_rss_mb(), 1),
+            'phases': {phase: round(timings[phase], 4) for phase in PHASES}}
+
+
+def get_peak_rss_mb():
+    """Peak resident memory of this process in MB"""
+    # ru_maxrss keeps the parent's peak across fork and exec, VmHWM starts fresh
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def benchmark_scale(scale, seed, repeat):
+    """Best phase times and peak memory over repeat runs of one scale"""
+    with tempfile.TemporaryDirectory() as data_directory:
+        SyntheticData.from_scale(scale, seed).write(data_directory)
+        runs = []
+        for _ in range(repeat):
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                runs.append(pool.apply(run_phases, (data_directory, seed)))
+    result = runs[0]
+    result['phases'] = {phase: min(run['phases'][phase] for run in runs) for phase in PHASES}
+    result['peak_rss_mb'] = min(run['peak_rss_mb'] for run in runs)
+    return result
+
+
+def find_regressions(scale, result, baseline, tolerance, min_seconds):
+    """Messages for each measurement worse than the baseline by more than the tolerance"""
+    if baseline['requests'] != result['requests']:
+        return ["{}: generated {} requests but the baseline has {}, rerun with --update-baseline".format(
+            scale, result['requests'], baseline['requests'])]
+    regressions = []
+    for phase in PHASES:
+        current, previous = result['phases'][phase], baseline['phases'].get(phase)
+        if previous is not None and current > previous * (1 + tolerance) and current - previous > min_seconds:
+            regressions.append("{}: {} took {:.3f}s, baseline {:.3f}s".format(scale, phase, current, previous))
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append("{}: peak memory {:.1f} MB, baseline {:.1f} MB".format(
+            scale, result['peak_rss_mb'], baseline['peak_rss_mb']))
+    if result['conflicts'] > baseline['conflicts']:
+        regressions.append("{}: {} conflicts, baseline {}".format(scale, result['conflicts'], baseline['conflicts']))
+    return regressions
+
+
+def print_results(results):
+    scales = list(results)
+    print("{:<34}".format("phase (s)") + "".join("{:>10}".format(scale) for scale in scales))
+    for phase in PHASES:
+        print("{:<34}".format(phase) + "".join("{:>10.3f}".format(results[scale]['phases'][phase])
+                                               for scale in scales))
+    for key, label in [('requests', "requests"), ('conflicts', "conflicts"), ('peak_rss_mb', "peak memory (MB)")]:
+        print("{:<34}".format(label) + "".join("{:>10}".format(results[scale][key]) for scale in scales))
+
+
+def main():
+    current_directory = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Time each scheduling phase on synthetic inputs")
+    parser.add_argument("--scales", nargs="+", choices=sorted(SCALES), default=["1x", "5x", "20x", "dense"])
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated inputs and the greedy run")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scale, the fastest time of each phase is kept")
+    parser.add_argument("--baseline", default=os.path.normpath(os.path.join(current_directory, "..", "benchmark_baseline.json")))
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown or memory growth")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="phase slowdowns below this are ignored")
+    parser.add_argument("--output", default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scales:
+        print("Benchmarking {} ...".format(scale))
+        results[scale] = benchmark_scale(scale, args.seed, args.repeat)
+    print_results(results)
+    machine = {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor()}
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump({'machine': machine, 'seed': args.seed, 'scales': results}, output_file, indent=2)
+
+    if args.update_baseline:
+        baseline = {'machine': machine, 'seed': args.seed, 'scales': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update({'machine': machine, 'seed': args.seed})
+        baseline['scales'].update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+        print("Baseline written to {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --update-baseline to create one".format(args.baseline))
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('seed') != args.seed:
+        print("Baseline was recorded with seed {}, not compared".format(baseline.get('seed')))
+        return 0
+    if baseline.get('machine') != machine:
+        print("Baseline was recorded on a different machine ({}), timings may not be comparable".format(
+            baseline.get('machine')))
+    regressions = []
+    for scale, result in results.items():
+        if scale in baseline['scales']:
+            regressions.extend(find_regressions(scale, result, baseline['scales'][scale],
+                                                args.tolerance, args.min_seconds))
+    for regression in regressions:
+        print("REGRESSION", regression)
+    if not regressions:
+        print("No regressions against {}".format(args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
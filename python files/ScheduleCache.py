@@ -0,0 +1,179 @@
+from SchedulingData import SchedulingData, PeriodGrid, Course, CourseOffering, Student, SportInfo
+from ScheduleMetrics import phase_timer
+import gc
+import hashlib
+import os
+import numpy as np
+
+# Bump when the snapshot layout or the request expansion changes
+CACHE_VERSION = 4
+
+INPUT_FILES = ["Courses.csv", "Cadets.csv", "Sports.csv", "PCO.csv", "Demand.csv", "Expansion Rules.csv"]
+# optional; read after every load since the snapshot does not hold it
+PREREQUISITE_FILE = "Prerequisites.csv"
+
+
+def hash_input_files(file_names, period_grid: PeriodGrid):
+    """Content hash of the input files and the period grid, used as the snapshot key"""
+    digest = hashlib.sha256("{},{}".format(CACHE_VERSION, period_grid.describe()).encode())
+    for file_name in file_names:
+        with open(file_name, 'rb') as input_file:
+            digest.update(hashlib.sha256(input_file.read()).digest())
+    return digest.hexdigest()
+
+
+def load_scheduling_data(data_directory, cache_directory=None, period_grid: PeriodGrid = None, metrics=None,
+                         term_schedule=None):
+    """
+    Loads the CSV inputs and expanded course requests, reusing a binary
+    snapshot when the inputs have not changed since it was written
+    data_directory: folder holding Courses.csv, Cadets.csv, Sports.csv, PCO.csv, Demand.csv and
+    Expansion Rules.csv, and optionally Prerequisites.csv
+    cache_directory: folder for snapshots, None disables the cache
+    period_grid: semesters and periods to load, the full 3x8 year when None
+    metrics: ScheduleMetrics to time each loading phase in, or None
+    term_schedule: prior schedule CSV whose placements select the requests of a
+    grid that leaves out part of the year, see SchedulingData.input_term_schedule
+    """
+    if period_grid is None:
+        period_grid = PeriodGrid()
+    file_names = [os.path.join(data_directory, file_name) for file_name in INPUT_FILES]
+    snapshot_name = None
+    schedule_data = None
+    if cache_directory is not None:
+        key_files = file_names if term_schedule is None else file_names + [term_schedule]
+        snapshot_name = os.path.join(cache_directory, "inputs-{}.npz".format(
+            hash_input_files(key_files, period_grid)[:24]))
+        if os.path.exists(snapshot_name):
+            with phase_timer(metrics, "read_snapshot"):
+                schedule_data = read_snapshot(snapshot_name, period_grid)
+            print("Read {} course requests from snapshot {}".format(
+                len(schedule_data.course_requests), os.path.basename(snapshot_name)))
+
+    if schedule_data is None:
+        schedule_data = SchedulingData(period_grid=period_grid)
+        if term_schedule is not None:
+            with phase_timer(metrics, "input_term_schedule"):
+                schedule_data.input_term_schedule(term_schedule)
+        for loader, file_name in [(schedule_data.input_course_data, file_names[0]),
+                                  (schedule_data.input_student_data, file_names[1]),
+                                  (schedule_data.input_sport_data, file_names[2]),
+                                  (schedule_data.input_pco, file_names[3]),
+                                  (schedule_data.input_student_demand, file_names[4]),
+                                  (schedule_data.input_expansion_rules, file_names[5])]:
+            with phase_timer(metrics, loader.__name__):
+                loader(file_name)
+        with phase_timer(metrics, "expand_course_requests"):
+            schedule_data.expand_course_requests()
+
+        if snapshot_name is not None:
+            os.makedirs(cache_directory, exist_ok=True)
+            with phase_timer(metrics, "write_snapshot"):
+                write_snapshot(schedule_data, snapshot_name)
+
+    prerequisite_file_name = os.path.join(data_directory, PREREQUISITE_FILE)
+    if os.path.exists(prerequisite_file_name):
+        with phase_timer(metrics, "input_prerequisites"):
+            schedule_data.input_prerequisites(prerequisite_file_name)
+    return schedule_data
+
+
+def write_snapshot(schedule_data: SchedulingData, snapshot_name):
+    """
+    Writes the loaded inputs as array tables; strings are interned into
+    course and student ids so requests and offerings are integer columns
+    """
+    course_data = schedule_data.course_data
+    courses = list(course_data.courses.values())
+    course_ids = {course.course_name: index for index, course in enumerate(courses)}
+
+    # students with info in load order; students known only from requests
+    # are recreated by their first request in the same order as the CSV load
+    students = [val.info for val in schedule_data.student_lookup.students.values() if val.info is not None]
+    student_names = list(schedule_data.course_requests.student_names)
+    for student in students:
+        if student.student_name not in schedule_data.course_requests.student_ids:
+            student_names.append(student.student_name)
+    student_ids = {student_name: index for index, student_name in enumerate(student_names)}
+
+    offerings = [offering for semester in course_data.lookupByClassID
+                 for course_offerings in semester.values()
+                 for offering in course_offerings if offering is not None]
+    sports = list(schedule_data.sport_info.values())
+    requests = schedule_data.course_requests.requests
+
+    tables = {
+        'course_name': np.array([course.course_name for course in courses], dtype=str),
+        'course_dept': np.array([course.dept for course in courses], dtype=str),
+        'course_credits': np.array([course.credits for course in courses], dtype=str),
+        'course_contact': np.array([course.contact for course in courses], dtype=np.int16),
+        'course_min_seats': np.array([course.min_seats for course in courses], dtype=str),
+        'course_max_seats': np.array([course.max_seats for course in courses], dtype=str),
+        'student_name': np.array(student_names, dtype=str),
+        'info_student': np.array([student_ids[student.student_name] for student in students], dtype=np.int32),
+        'info_year': np.array([student.year for student in students], dtype=str),
+        'info_sport': np.array([student.sport for student in students], dtype=str),
+        'info_gender': np.array([student.gender for student in students], dtype=str),
+        'sport': np.array([[sport.sport, sport.gender, sport.practice_m, sport.practice_t]
+                           for sport in sports], dtype=str).reshape(-1, 4),
+        'sport_offseason': np.array([sport.offseason for sport in sports], dtype=np.int8),
+        'offering_course': np.array([course_ids[offering.course_name] for offering in offerings], dtype=np.int32),
+        'offering_semester': np.array([offering.semester for offering in offerings], dtype=np.int8),
+        'offering_period': np.array([offering.period for offering in offerings], dtype=np.int8),
+        'offering_seats': np.array([offering.number_seats_total for offering in offerings], dtype=np.int32),
+        'request_student': np.array([student_ids[request.student_name] for request in requests], dtype=np.int32),
+        'request_course': np.array([course_ids[request.course_name] for request in requests], dtype=np.int32),
+    }
+    # write then rename so an interrupted run never leaves a partial snapshot
+    temporary_name = snapshot_name + ".tmp"
+    with open(temporary_name, 'wb') as snapshot_file:
+        np.savez(snapshot_file, **tables)
+    os.replace(temporary_name, snapshot_name)
+
+
+def read_snapshot(snapshot_name, period_grid: PeriodGrid = None):
+    """Rebuilds a SchedulingData from a snapshot written by write_snapshot"""
+    with np.load(snapshot_name) as snapshot:
+        tables = {name: snapshot[name] for name in snapshot.files}
+
+    # the rebuild only allocates, so skip the collector passes it would trigger
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return build_from_tables(tables, period_grid or PeriodGrid())
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def build_from_tables(tables, period_grid: PeriodGrid):
+    schedule_data = SchedulingData(period_grid=period_grid)
+    course_names = tables['course_name'].tolist()
+    for course_name, dept, credits, contact, min_seats, max_seats in zip(
+            course_names, tables['course_dept'].tolist(), tables['course_credits'].tolist(),
+            tables['course_contact'].tolist(), tables['course_min_seats'].tolist(),
+            tables['course_max_seats'].tolist()):
+        schedule_data.course_data.add_course_data(Course(course_name, dept, credits, contact, min_seats, max_seats))
+
+    student_names = tables['student_name'].tolist()
+    for student_id, year, sport, gender in zip(tables['info_student'].tolist(), tables['info_year'].tolist(),
+                                               tables['info_sport'].tolist(), tables['info_gender'].tolist()):
+        schedule_data.student_lookup.add_student_info(Student(student_names[student_id], year, sport, gender))
+
+    for (sport, gender, practice_m, practice_t), offseason in zip(tables['sport'].tolist(),
+                                                                   tables['sport_offseason'].tolist()):
+        schedule_data.sport_info[(sport, gender)] = SportInfo(sport, gender, practice_m, practice_t, offseason)
+
+    courses = schedule_data.course_data.courses
+    for course_id, semester, period, seats in zip(tables['offering_course'].tolist(),
+                                                  tables['offering_semester'].tolist(),
+                                                  tables['offering_period'].tolist(),
+                                                  tables['offering_seats'].tolist()):
+        course_name = course_names[course_id]
+        schedule_data.course_data.add_course_offering(
+            CourseOffering(course_name, semester, period, seats, courses[course_name]))
+    schedule_data.course_data.build_course_index()
+
+    schedule_data.add_interned_course_requests(student_names, course_names,
+                                               tables['request_student'], tables['request_course'])
+    return schedule_data
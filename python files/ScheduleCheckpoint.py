@@ -0,0 +1,86 @@
+import hashlib
+import os
+import numpy as np
+
+# Periodic checkpoints of a scheduling run in a memory-mapped file. The file
+# holds two slots of fixed-size arrays; a save writes the slot that is not
+# current, flushes it and then flips the current slot, so an interruption
+# mid-save leaves the previous checkpoint readable
+
+CHECKPOINT_VERSION = 1
+
+
+class ScheduleCheckpoint:
+    """
+    Double-buffered checkpoint file of named arrays
+    fields{name} <- (dtype, capacity); each save stores up to capacity values
+    of every field and the number stored, so variable-length state such as
+    the remaining queue fits a fixed layout
+    key: identifies the inputs and settings of the run; a file written with
+    another key, or another layout, is not resumed from
+    """
+    def __init__(self, file_name, fields, key=""):
+        self.file_name = file_name
+        self.fields = fields
+        self.key = np.frombuffer(hashlib.sha256(key.encode()).digest(), dtype=np.uint8)
+        slot_dtype = np.dtype([('generation', np.int64)] +
+                              [(name + '_length', np.int64) for name in fields] +
+                              [(name, dtype, (max(capacity, 1),)) for name, (dtype, capacity) in fields.items()])
+        self.file_dtype = np.dtype([('version', np.int64), ('key', np.uint8, (32,)), ('current', np.int64),
+                                    ('slots', slot_dtype, (2,))])
+        self.checkpoint_file = None
+        self.generation = 0
+
+    def load(self):
+        """The arrays of the current checkpoint, or None when there is no usable checkpoint"""
+        if not os.path.exists(self.file_name) or os.path.getsize(self.file_name) != self.file_dtype.itemsize:
+            return None
+        checkpoint_file = np.memmap(self.file_name, dtype=self.file_dtype, mode='r', shape=(1,))
+        try:
+            current = int(checkpoint_file['current'][0])
+            if checkpoint_file['version'][0] != CHECKPOINT_VERSION or current < 0 or \
+                    not np.array_equal(checkpoint_file['key'][0], self.key):
+                return None
+            slots = checkpoint_file['slots']
+            state = {'generation': int(slots['generation'][0, current])}
+            for name in self.fields:
+                state[name] = np.array(slots[name][0, current, :int(slots[name + '_length'][0, current])])
+            return state
+        finally:
+            del checkpoint_file
+
+    def save(self, state):
+        """
+        Writes state{name} <- array for every field into the slot that is not
+        current, then makes it current
+        """
+        if self.checkpoint_file is None:
+            previous = self.load()
+            if previous is not None:
+                # keep the checkpoint being resumed from current until the first save completes
+                self.checkpoint_file = np.memmap(self.file_name, dtype=self.file_dtype, mode='r+', shape=(1,))
+                self.generation = previous['generation']
+            else:
+                self.checkpoint_file = np.memmap(self.file_name, dtype=self.file_dtype, mode='w+', shape=(1,))
+                self.checkpoint_file['version'][0] = CHECKPOINT_VERSION
+                self.checkpoint_file['key'][0] = self.key
+                self.checkpoint_file['current'][0] = -1
+        checkpoint_file = self.checkpoint_file
+        slot = 1 - max(int(checkpoint_file['current'][0]), 0)
+        slots = checkpoint_file['slots']
+        self.generation += 1
+        slots['generation'][0, slot] = self.generation
+        for name, (dtype, capacity) in self.fields.items():
+            values = np.asarray(state[name])
+            if len(values) > capacity:
+                raise ValueError("Checkpoint field {} holds {} values, {} given".format(name, capacity, len(values)))
+            slots[name][0, slot, :len(values)] = values
+            slots[name + '_length'][0, slot] = len(values)
+        checkpoint_file.flush()
+        checkpoint_file['current'][0] = slot
+        checkpoint_file.flush()
+
+    def close(self):
+        if self.checkpoint_file is not None:
+            del self.checkpoint_file
+            self.checkpoint_file = None
@@ -0,0 +1,128 @@
+from SchedulingData import SchedulingData
+from ScheduleReports import ScheduleReports
+import os
+import sqlite3
+import numpy as np
+
+# Optional SQLite copy of a finished schedule, indexed for point lookups by
+# cadet and by offering so tools do not have to parse the schedule CSV
+
+SCHEMA = """
+CREATE TABLE students (student_id INTEGER PRIMARY KEY, student_name TEXT NOT NULL, year TEXT, sport TEXT);
+CREATE TABLE offerings (offering_id INTEGER PRIMARY KEY, course TEXT NOT NULL, dept TEXT, semester TEXT NOT NULL,
+                        period TEXT NOT NULL, slot INTEGER NOT NULL, seats INTEGER NOT NULL, enrolled INTEGER NOT NULL);
+CREATE TABLE assignments (request_id INTEGER PRIMARY KEY, student_id INTEGER NOT NULL, offering_id INTEGER NOT NULL);
+CREATE TABLE conflicts (request_id INTEGER PRIMARY KEY, student_id INTEGER NOT NULL, course TEXT NOT NULL);
+"""
+
+# built after the bulk insert, which is faster than maintaining them row by row
+INDEXES = """
+CREATE UNIQUE INDEX students_by_name ON students (student_name);
+CREATE INDEX offerings_by_course ON offerings (course, semester, period);
+CREATE INDEX assignments_by_student ON assignments (student_id);
+CREATE INDEX assignments_by_offering ON assignments (offering_id);
+CREATE INDEX conflicts_by_student ON conflicts (student_id);
+CREATE INDEX conflicts_by_course ON conflicts (course);
+"""
+
+
+def export_schedule_database(schedule_data: SchedulingData, file_name, reports: ScheduleReports = None):
+    """
+    Writes the schedule to a new SQLite database in one transaction; the file
+    is built beside file_name and renamed over it once complete
+    reports: ScheduleReports of the same schedule to reuse its pass over the requests
+    """
+    if reports is None:
+        reports = ScheduleReports(schedule_data)
+    period_grid = schedule_data.period_grid
+    course_requests = schedule_data.course_requests
+    student_info = schedule_data.student_lookup.students
+    request_student = np.frombuffer(course_requests.request_student, dtype=np.int32)
+    request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+
+    students = []
+    for student_id, student_name in enumerate(course_requests.student_names):
+        info = student_info[student_name].info if student_name in student_info else None
+        students.append((student_id, student_name, None if info is None else info.year,
+                         None if info is None else info.sport))
+    offerings = [(offering.offering_id, offering.course_name, offering.course_info.dept,
+                  period_grid.semester_names[offering.semester], period_grid.period_labels[offering.period],
+                  int(reports.offering_slot[offering.offering_id]), offering.number_seats_total,
+                  int(reports.offering_enrolled[offering.offering_id]))
+                 for offering in schedule_data.course_data.offerings]
+    scheduled = np.flatnonzero(reports.request_offering >= 0)
+    unscheduled = np.flatnonzero(reports.request_offering < 0)
+    assignments = zip(scheduled.tolist(), request_student[scheduled].tolist(),
+                      reports.request_offering[scheduled].tolist())
+    conflicts = zip(unscheduled.tolist(), request_student[unscheduled].tolist(),
+                    (course_requests.course_names[course_id] for course_id in request_course[unscheduled].tolist()))
+
+    temporary_name = file_name + ".tmp"
+    if os.path.exists(temporary_name):
+        os.remove(temporary_name)
+    connection = sqlite3.connect(temporary_name)
+    try:
+        # the file only replaces the database once complete, so skip the journal
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        with connection:
+            connection.executescript("BEGIN;" + SCHEMA)
+            connection.executemany("INSERT INTO students VALUES (?, ?, ?, ?)", students)
+            connection.executemany("INSERT INTO offerings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", offerings)
+            connection.executemany("INSERT INTO assignments VALUES (?, ?, ?)", assignments)
+            connection.executemany("INSERT INTO conflicts VALUES (?, ?, ?)", conflicts)
+            for statement in INDEXES.strip().splitlines():
+                connection.execute(statement)
+    finally:
+        connection.close()
+    os.replace(temporary_name, file_name)
+
+
+class ScheduleDatabase:
+    """Point queries on a database written by export_schedule_database"""
+
+    def __init__(self, file_name):
+        if not os.path.exists(file_name):
+            raise FileNotFoundError(file_name)
+        self.connection = sqlite3.connect("file:{}?mode=ro".format(file_name), uri=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_student_schedule(self, student_name):
+        """[(course, semester, period)] of a cadet, semester and period are None for unscheduled requests"""
+        return self.connection.execute("""
+            SELECT course, semester, period FROM (
+                SELECT o.course, o.semester, o.period, o.slot FROM students s
+                JOIN assignments a ON a.student_id = s.student_id JOIN offerings o ON o.offering_id = a.offering_id
+                WHERE s.student_name = ?
+                UNION ALL
+                SELECT c.course, NULL, NULL, NULL FROM students s JOIN conflicts c ON c.student_id = s.student_id
+                WHERE s.student_name = ?)
+            ORDER BY slot IS NULL, slot, course""", (student_name, student_name)).fetchall()
+
+    def get_offering_roster(self, course_name, semester_name, period_label):
+        """[student_name] enrolled in a course at a semester/period"""
+        return [row[0] for row in self.connection.execute("""
+            SELECT s.student_name FROM offerings o
+            JOIN assignments a ON a.offering_id = o.offering_id JOIN students s ON s.student_id = a.student_id
+            WHERE o.course = ? AND o.semester = ? AND o.period = ?
+            ORDER BY s.student_name""", (course_name, semester_name, period_label))]
+
+    def get_offering_fill(self, course_name):
+        """[(semester, period, enrolled, seats)] of a course in semester/period order"""
+        return self.connection.execute("""
+            SELECT semester, period, enrolled, seats FROM offerings WHERE course = ? ORDER BY slot""",
+                                       (course_name,)).fetchall()
+
+    def get_course_conflicts(self, course_name):
+        """[student_name] whose request for the course is unscheduled"""
+        return [row[0] for row in self.connection.execute("""
+            SELECT s.student_name FROM conflicts c JOIN students s ON s.student_id = c.student_id
+            WHERE c.course = ? ORDER BY s.student_name""", (course_name,))]
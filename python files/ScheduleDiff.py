@@ -0,0 +1,158 @@
+import argparse
+import csv
+import math
+import os
+import tempfile
+import zlib
+
+# Compares two schedules written by output_student_schedules. The old file
+# is indexed by (student, course) and the new file is streamed against the
+# index; when the old file is larger than the index budget both files are
+# first split into buckets by student so each bucket's index fits, and the
+# join runs one bucket at a time
+
+CHANGE_TYPES = ["moved", "newly scheduled", "newly conflicted", "added", "removed"]
+DIFF_FILES = {
+    'students': "Schedule Changes.csv",
+    'offerings': "Offering Changes.csv",
+}
+
+
+def read_schedule_rows(csv_file_name):
+    """Yields (student, course, (semester, period)) rows, with a blank semester and period when unscheduled"""
+    # Header: student, semester, course, period
+    with open(csv_file_name, newline='') as csvfile:
+        schedule_reader = csv.reader(csvfile)
+        header = True
+
+        for row in schedule_reader:
+            if header:
+                header = False
+                continue
+            yield row[0], row[2], (row[1], row[3])
+
+
+def classify_change(old_placement, new_placement):
+    """The change between two placements of one request, None when there is none"""
+    if old_placement == new_placement:
+        return None
+    if old_placement is None:
+        return "added"
+    if new_placement is None:
+        return "removed"
+    if not old_placement[0]:
+        return "newly scheduled"
+    if not new_placement[0]:
+        return "newly conflicted"
+    return "moved"
+
+
+class ScheduleDiff:
+    """
+    Request-level differences between an old and a new schedule file
+    self.counts{change type} <- requests, plus 'unchanged'
+    self.offering_changes{(course, semester, period)} <- [students joined, students left]
+    """
+
+    def __init__(self, max_index_bytes=32 * 2**20):
+        """max_index_bytes: size of old schedule file indexed at once; larger files are bucketed by student"""
+        self.max_index_bytes = max_index_bytes
+        self.counts = dict.fromkeys(["unchanged"] + CHANGE_TYPES, 0)
+        self.offering_changes = {}
+
+    def compare(self, old_file_name, new_file_name, output_directory):
+        """Writes the changed requests and the per-offering changes into output_directory"""
+        os.makedirs(output_directory, exist_ok=True)
+        number_buckets = max(1, math.ceil(os.path.getsize(old_file_name) / self.max_index_bytes))
+        with open(os.path.join(output_directory, DIFF_FILES['students']), 'w', newline='') as changes_file:
+            changes_writer = csv.writer(changes_file)
+            changes_writer.writerow(["Student", "Course", "Change", "Old Semester", "Old Period",
+                                     "New Semester", "New Period"])
+            if number_buckets == 1:
+                self.join(read_schedule_rows(old_file_name), read_schedule_rows(new_file_name), changes_writer)
+            else:
+                with tempfile.TemporaryDirectory() as bucket_directory:
+                    old_buckets = self.split(old_file_name, number_buckets, os.path.join(bucket_directory, "old"))
+                    new_buckets = self.split(new_file_name, number_buckets, os.path.join(bucket_directory, "new"))
+                    for old_bucket, new_bucket in zip(old_buckets, new_buckets):
+                        self.join(read_schedule_rows(old_bucket), read_schedule_rows(new_bucket), changes_writer)
+
+        with open(os.path.join(output_directory, DIFF_FILES['offerings']), 'w', newline='') as offerings_file:
+            offerings_writer = csv.writer(offerings_file)
+            offerings_writer.writerow(["Course", "Semester", "Period", "Joined", "Left", "Net"])
+            offerings_writer.writerows([course, semester, period, joined, left, joined - left]
+                                       for (course, semester, period), (joined, left)
+                                       in sorted(self.offering_changes.items()))
+        return self.counts
+
+    @staticmethod
+    def split(csv_file_name, number_buckets, bucket_prefix):
+        """Copies the rows of a schedule into files bucketed by a hash of the student"""
+        bucket_names = ["{}-{}.csv".format(bucket_prefix, bucket) for bucket in range(number_buckets)]
+        bucket_files = [open(bucket_name, 'w', newline='') for bucket_name in bucket_names]
+        try:
+            bucket_writers = [csv.writer(bucket_file) for bucket_file in bucket_files]
+            for bucket_writer in bucket_writers:
+                bucket_writer.writerow(["student", "semester", "course", "period"])
+            for student, course, (semester, period) in read_schedule_rows(csv_file_name):
+                bucket_writers[zlib.crc32(student.encode()) % number_buckets].writerow(
+                    [student, semester, course, period])
+        finally:
+            for bucket_file in bucket_files:
+                bucket_file.close()
+        return bucket_names
+
+    def join(self, old_rows, new_rows, changes_writer):
+        """Hash join of one bucket: index the old rows, stream the new rows against it"""
+        old_index = {} # (student, course) -> [placement]
+        for student, course, placement in old_rows:
+            old_index.setdefault((student, course), []).append(placement)
+
+        # new placements that do not match an old one exactly, paired once the stream ends
+        unmatched = {}
+        for student, course, placement in new_rows:
+            placements = old_index.get((student, course))
+            if placements and placement in placements:
+                placements.remove(placement)
+                self.counts['unchanged'] += 1
+            else:
+                unmatched.setdefault((student, course), []).append(placement)
+
+        changes = []
+        for key, new_placements in unmatched.items():
+            old_placements = old_index.pop(key, [])
+            for index in range(max(len(old_placements), len(new_placements))):
+                changes.append((key, old_placements[index] if index < len(old_placements) else None,
+                                new_placements[index] if index < len(new_placements) else None))
+        for key, old_placements in old_index.items():
+            changes.extend((key, old_placement, None) for old_placement in old_placements)
+
+        rows = []
+        for (student, course), old_placement, new_placement in sorted(changes, key=lambda change: change[0]):
+            change = classify_change(old_placement, new_placement)
+            self.counts[change] += 1
+            # an unscheduled request has a blank semester and holds no seat
+            if old_placement is not None and old_placement[0]:
+                self.offering_changes.setdefault((course,) + old_placement, [0, 0])[1] += 1
+            if new_placement is not None and new_placement[0]:
+                self.offering_changes.setdefault((course,) + new_placement, [0, 0])[0] += 1
+            rows.append([student, course, change] + list(old_placement or ("", "")) +
+                        list(new_placement or ("", "")))
+        changes_writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the requests that changed between two schedule files")
+    parser.add_argument("old_schedule")
+    parser.add_argument("new_schedule")
+    parser.add_argument("--output", default=".", help="folder for Schedule Changes.csv and Offering Changes.csv")
+    parser.add_argument("--max-index-mb", type=float, default=32,
+                        help="larger old schedules are compared in buckets of about this size")
+    args = parser.parse_args()
+
+    counts = ScheduleDiff(int(args.max_index_mb * 2**20)).compare(args.old_schedule, args.new_schedule, args.output)
+    print(", ".join("{} {}".format(counts[change], change) for change in ["unchanged"] + CHANGE_TYPES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from contextlib import contextmanager, nullcontext
+import cProfile
+import json
+import pstats
+import time
+
+# Opt-in instrumentation for a scheduling run. Code that is instrumented keeps
+# a metrics reference that is None when disabled and checks it once per phase
+# or per queue pop, so a run without metrics only pays for that check
+
+CONFLICT_REASONS = ["no offering", "student busy", "prerequisite order", "seats full"]
+
+
+def phase_timer(metrics, name, profile=False):
+    """Context manager timing one phase, or doing nothing when metrics is None"""
+    if metrics is None:
+        return nullcontext()
+    return metrics.phase(name, profile)
+
+
+class ScheduleMetrics:
+    """
+    Timers, counters and fill rates collected during a run
+    self.phases{name} <- seconds spent in the phase
+    self.counters{name} <- count
+    self.conflicts_by_reason{reason} <- unscheduled requests
+    self.fill_samples <- [(pops, {course_name: fraction of seats filled})]
+    """
+
+    def __init__(self, fill_sample_interval=2000, profile_limit=30):
+        """
+        fill_sample_interval: queue pops between course fill rate samples
+        profile_limit: number of functions kept from each profiled phase
+        """
+        self.fill_sample_interval = fill_sample_interval
+        self.profile_limit = profile_limit
+        self.phases = {}
+        self.counters = {}
+        self.conflicts_by_reason = {reason: 0 for reason in CONFLICT_REASONS}
+        self.fill_samples = []
+        self.profiles = {}
+
+    @contextmanager
+    def phase(self, name, profile=False):
+        """Times the enclosed block, under cProfile when profile is set"""
+        profiler = cProfile.Profile() if profile else None
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profiles[name] = self.summarize_profile(profiler)
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_conflict(self, reason, amount=1):
+        self.conflicts_by_reason[reason] += amount
+
+    def sample_fill(self, pops, course_data):
+        """Records the fraction of seats filled in every offered course"""
+        fill = {}
+        for course_name, capacity in course_data.course_index.items():
+            if capacity.number_seats > 0:
+                enrolled = sum(len(offering.students_enrolled) for offering in capacity.offerings)
+                fill[course_name] = round(enrolled / capacity.number_seats, 4)
+        self.fill_samples.append((pops, fill))
+
+    def summarize_profile(self, profiler):
+        """The profiled functions with the most cumulative time"""
+        stats = pstats.Stats(profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.profile_limit]
+        return [{'function': "{}:{}({})".format(*key), 'calls': value[1],
+                 'total_time': round(value[2], 4), 'cumulative_time': round(value[3], 4)}
+                for key, value in rows]
+
+    def report(self):
+        """The metrics as a JSON-serializable dict; fill rates are listed per course over the samples"""
+        courses = sorted({course_name for _, fill in self.fill_samples for course_name in fill})
+        return {
+            'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            'counters': dict(self.counters),
+            'conflicts_by_reason': dict(self.conflicts_by_reason),
+            'fill_rate': {
+                'pops': [pops for pops, _ in self.fill_samples],
+                'courses': {course_name: [fill.get(course_name, 0) for _, fill in self.fill_samples]
+                            for course_name in courses},
+            },
+            'profiles': self.profiles,
+        }
+
+    def write_report(self, file_name):
+        with open(file_name, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
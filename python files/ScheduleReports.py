@@ -0,0 +1,158 @@
+from SchedulingData import SchedulingData
+import csv
+import os
+import numpy as np
+
+# Reports on a finished schedule. ScheduleReports makes a single pass over
+# the requests to find each one's offering; the rosters, fill rates,
+# unscheduled lists and department totals are then grouped from those
+# arrays, so another report does not add another scan of the schedule
+
+REPORT_FILES = {
+    'rosters': "Class Rosters.csv",
+    'offering_fill': "Offering Fill.csv",
+    'fill_matrix': "Fill Matrix.csv",
+    'unscheduled': "Unscheduled Requests.csv",
+    'departments': "Department Summary.csv",
+}
+
+
+class ScheduleReports:
+    """
+    Arrays collected from one pass over the assignment state
+    self.request_offering[request_id] <- offering_id, -1 when unscheduled
+    self.offering_enrolled[offering_id] / self.offering_seats[offering_id] <- students / seats
+    self.fill_matrix[course_id][semester*number_periods + period] <- enrolled / seats, NaN where the course
+    has no seats, course ids are those of CourseLookupData.courses
+    """
+
+    def __init__(self, schedule_data: SchedulingData):
+        self.schedule_data = schedule_data
+        course_data = schedule_data.course_data
+        course_requests = schedule_data.course_requests
+        # the only pass over the requests
+        self.request_offering = np.fromiter(
+            (-1 if request.assigned_course is None else request.assigned_course.offering_id
+             for request in course_requests.requests), dtype=np.int64, count=len(course_requests))
+
+        offerings = course_data.offerings
+        self.offering_course = np.array([offering.course_info.course_id for offering in offerings], dtype=np.int64)
+        self.offering_slot = np.array([offering.semester * course_data.number_periods + offering.period
+                                       for offering in offerings], dtype=np.int64)
+        self.offering_seats = np.array([offering.number_seats_total for offering in offerings], dtype=np.int64)
+        scheduled = self.request_offering >= 0
+        self.offering_enrolled = np.bincount(self.request_offering[scheduled], minlength=len(offerings))
+
+        number_slots = len(course_data.lookupByPeriod) * course_data.number_periods
+        self.fill_matrix = np.full((len(course_data.courses), number_slots), np.nan)
+        offered = self.offering_seats > 0
+        self.fill_matrix[self.offering_course[offered], self.offering_slot[offered]] = \
+            self.offering_enrolled[offered] / self.offering_seats[offered]
+
+        # departments of the store's interned courses
+        self.course_dept = [course_data.courses[course_name].dept for course_name in course_requests.course_names]
+
+    def get_roster_rows(self):
+        """[semester, period, course, student] for every scheduled request, by offering then student"""
+        period_grid = self.schedule_data.period_grid
+        course_requests = self.schedule_data.course_requests
+        offerings = self.schedule_data.course_data.offerings
+        request_student = np.frombuffer(course_requests.request_student, dtype=np.int32)
+        request_ids = np.flatnonzero(self.request_offering >= 0)
+        # offerings in semester, period, course order
+        offering_order = sorted(range(len(offerings)), key=lambda offering_id: (
+            self.offering_slot[offering_id], offerings[offering_id].course_name))
+        offering_rank = np.empty(len(offerings), dtype=np.int64)
+        offering_rank[offering_order] = np.arange(len(offerings))
+        request_ids = request_ids[np.lexsort((request_student[request_ids],
+                                             offering_rank[self.request_offering[request_ids]]))]
+        student_names = course_requests.student_names
+        return [[period_grid.semester_names[offering.semester], period_grid.period_labels[offering.period],
+                 offering.course_name, student_names[student_id]]
+                for offering, student_id in zip((offerings[offering_id] for offering_id in
+                                                 self.request_offering[request_ids].tolist()),
+                                                request_student[request_ids].tolist())]
+
+    def get_offering_fill_rows(self):
+        """[semester, period, course, dept, enrolled, seats, available, fill rate] for every offering"""
+        period_grid = self.schedule_data.period_grid
+        rows = []
+        for offering in self.schedule_data.course_data.offerings:
+            enrolled = int(self.offering_enrolled[offering.offering_id])
+            seats = offering.number_seats_total
+            if seats == 0 and enrolled == 0:
+                continue
+            rows.append([period_grid.semester_names[offering.semester], period_grid.period_labels[offering.period],
+                         offering.course_name, offering.course_info.dept, enrolled, seats, seats - enrolled,
+                         round(enrolled / seats, 3) if seats > 0 else ""])
+        rows.sort(key=lambda row: (period_grid.semester_names.index(row[0]),
+                                   period_grid.period_labels.index(row[1]), row[2]))
+        return rows
+
+    def get_fill_matrix_rows(self):
+        """[course, fill rate of each semester/period] for every course with seats, blank where it has none"""
+        course_names = list(self.schedule_data.course_data.courses)
+        offered = np.flatnonzero(~np.isnan(self.fill_matrix).all(axis=1))
+        rows = [[course_names[course_id]] + ["" if np.isnan(fill) else round(fill, 3)
+                                             for fill in self.fill_matrix[course_id].tolist()]
+                for course_id in offered.tolist()]
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    def get_unscheduled_rows(self):
+        """[student, number unscheduled, courses] for every student with an unscheduled request"""
+        course_requests = self.schedule_data.course_requests
+        request_student = np.frombuffer(course_requests.request_student, dtype=np.int32)
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+        request_ids = np.flatnonzero(self.request_offering < 0)
+        request_ids = request_ids[np.argsort(request_student[request_ids], kind='stable')]
+        rows = {}
+        for student_id, course_id in zip(request_student[request_ids].tolist(), request_course[request_ids].tolist()):
+            rows.setdefault(student_id, []).append(course_requests.course_names[course_id])
+        return [[course_requests.student_names[student_id], len(courses), "; ".join(courses)]
+                for student_id, courses in rows.items()]
+
+    def get_department_rows(self):
+        """[dept, offerings, seats, enrolled, requests, unscheduled, fill rate] by department"""
+        course_requests = self.schedule_data.course_requests
+        course_data = self.schedule_data.course_data
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+        depts = sorted(set(course.dept for course in course_data.courses.values()))
+        dept_index = {dept: index for index, dept in enumerate(depts)}
+        offering_dept = np.array([dept_index[offering.course_info.dept] for offering in course_data.offerings],
+                                 dtype=np.int64)
+        request_dept = np.array([dept_index[dept] for dept in self.course_dept], dtype=np.int64)[request_course]
+        offered = self.offering_seats > 0
+        offerings = np.bincount(offering_dept[offered], minlength=len(depts))
+        seats = np.bincount(offering_dept, weights=self.offering_seats, minlength=len(depts)).astype(np.int64)
+        enrolled = np.bincount(offering_dept, weights=self.offering_enrolled, minlength=len(depts)).astype(np.int64)
+        requests = np.bincount(request_dept, minlength=len(depts))
+        unscheduled = np.bincount(request_dept[self.request_offering < 0], minlength=len(depts))
+        return [[dept, int(offerings[index]), int(seats[index]), int(enrolled[index]), int(requests[index]),
+                 int(unscheduled[index]), round(enrolled[index] / seats[index], 3) if seats[index] > 0 else ""]
+                for index, dept in enumerate(depts) if seats[index] > 0 or requests[index] > 0]
+
+    def write(self, output_directory):
+        """Writes every report into output_directory and returns the file names"""
+        os.makedirs(output_directory, exist_ok=True)
+        period_grid = self.schedule_data.period_grid
+        slot_labels = ["{} {}".format(semester_name, period_label) for semester_name in period_grid.semester_names
+                       for period_label in period_grid.period_labels]
+        reports = [
+            ('rosters', ["Semester", "Period", "Course", "Student"], self.get_roster_rows()),
+            ('offering_fill', ["Semester", "Period", "Course", "Dept", "Enrolled", "Seats", "Available", "Fill Rate"],
+             self.get_offering_fill_rows()),
+            ('fill_matrix', ["Course"] + slot_labels, self.get_fill_matrix_rows()),
+            ('unscheduled', ["Student", "Unscheduled", "Courses"], self.get_unscheduled_rows()),
+            ('departments', ["Dept", "Offerings", "Seats", "Enrolled", "Requests", "Unscheduled", "Fill Rate"],
+             self.get_department_rows()),
+        ]
+        file_names = []
+        for report, header, rows in reports:
+            file_name = os.path.join(output_directory, REPORT_FILES[report])
+            with open(file_name, 'w', newline='') as csvfile:
+                report_writer = csv.writer(csvfile)
+                report_writer.writerow(header)
+                report_writer.writerows(rows)
+            file_names.append(file_name)
+        return file_names
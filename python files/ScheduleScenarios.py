@@ -0,0 +1,189 @@
+from ScheduleCache import load_scheduling_data
+from SchedulingData import SchedulingData
+from SchedulingAlgorithm import ScheduleCourses, ScheduleRepair
+import argparse
+import csv
+import gc
+import multiprocessing
+import os.path
+
+# What-if scenarios over a loaded schedule. Each scenario runs in a process
+# forked from the loaded SchedulingData, so the offering and enrollment
+# tables are shared copy-on-write and only the pages a scenario changes are
+# copied; the scenario's PCO edits are applied and only the requests left
+# unscheduled are scheduled again
+
+
+class OfferingEdit:
+    """
+    A PCO change: sections added to a course at one semester/period, or
+    removed when sections is negative
+    section_seats: seats per section, the course's Max when None
+    """
+    __slots__ = ('course_name', 'semester_name', 'period_label', 'sections', 'section_seats')
+
+    def __init__(self, course_name, semester_name, period_label, sections, section_seats=None):
+        self.course_name = course_name
+        self.semester_name = semester_name
+        self.period_label = period_label
+        self.sections = sections
+        self.section_seats = section_seats
+
+    def apply(self, schedule_data: SchedulingData):
+        """Changes the offering's seats, returning the requests displaced from it"""
+        if self.course_name not in schedule_data.course_data.courses:
+            raise ValueError("Unknown course {}".format(self.course_name))
+        semester = schedule_data.period_grid.get_semester(self.semester_name)
+        if semester is None:
+            raise ValueError("Semester {} is not scheduled".format(self.semester_name))
+        period = schedule_data.period_grid.get_period(self.period_label)
+        section_seats = self.section_seats
+        if section_seats is None:
+            section_seats = int(schedule_data.course_data.courses[self.course_name].max_seats)
+        return schedule_data.change_offering_seats(self.course_name, semester, period,
+                                                   self.sections * section_seats)
+
+
+def read_scenarios(csv_file_name):
+    """
+    Reads scenarios from a CSV, one edit per row; rows with the same scenario
+    name are applied together
+    :return: {scenario name: [OfferingEdit]} in file order
+    """
+    # Header: Scenario, Course Lookup, Semester, Period, Sections, Max (blank for the course's Max)
+    scenarios = {}
+    with open(csv_file_name) as csvfile:
+        scenario_reader = csv.reader(csvfile)
+        header = True
+
+        for row in scenario_reader:
+            if header:
+                header = False
+                continue
+            section_seats = int(row[5]) if len(row) > 5 and row[5] else None
+            scenarios.setdefault(row[0], []).append(OfferingEdit(row[1], row[2], row[3], int(row[4]), section_seats))
+    return scenarios
+
+
+# the loaded SchedulingData, inherited by each forked scenario process
+_base_schedule_data = None
+
+
+def _evaluate_scenario(name, edits, seed, repair_time):
+    """
+    Applies one scenario's edits to the forked data, places the displaced
+    requests of each course as a batch and then schedules the rest of the
+    unscheduled requests
+    """
+    schedule_data = _base_schedule_data
+    displaced = []
+    for edit in edits:
+        displaced.extend(edit.apply(schedule_data))
+    scheduler = ScheduleCourses(schedule_data, seed, verbose=False)
+    displaced_by_course = {}
+    for student_course_request in displaced:
+        displaced_by_course.setdefault(student_course_request.course_name, []).append(
+            student_course_request.request_id)
+    for request_ids in displaced_by_course.values():
+        scheduler.place_course_requests(request_ids)
+    # displaced requests with no seat left are already conflicts
+    placed_conflicts = {student_course_request.request_id for student_course_request in scheduler.schedule_conflict}
+    scheduler.create_unscheduled_priority_queue(
+        request_id for request_id in schedule_data.course_requests.unscheduled.keys()
+        if request_id not in placed_conflicts)
+    scheduler.match_courses_greedy_algorithm()
+    schedule_conflict = scheduler.schedule_conflict
+    if repair_time > 0:
+        schedule_conflict = ScheduleRepair(schedule_data, repair_time, verbose=False).repair_conflicts(
+            schedule_conflict)
+    course_conflicts = {}
+    for student_course_request in schedule_conflict:
+        course_conflicts[student_course_request.course_name] = \
+            course_conflicts.get(student_course_request.course_name, 0) + 1
+    return {'scenario': name, 'conflicts': len(schedule_conflict), 'displaced': len(displaced),
+            'course_conflicts': course_conflicts}
+
+
+class ScenarioRunner:
+    """
+    Evaluates what-if scenarios against a loaded SchedulingData, in parallel
+    The data may already hold a schedule, e.g. from a scheduling run or
+    input_prior_schedule; each scenario keeps those assignments and schedules
+    only what is unscheduled after its edits. An unedited baseline is run the
+    same way so deltas only reflect the edits
+    """
+    def __init__(self, schedule_data: SchedulingData, seed=0, repair_time=0, processes=None):
+        """
+        seed: greedy seed of every scenario
+        repair_time: seconds of repair after each scenario's greedy pass, 0 to skip
+        processes: scenarios run at once, defaults to the number of CPUs
+        """
+        self.schedule_data = schedule_data
+        self.seed = seed
+        self.repair_time = repair_time
+        self.processes = processes
+        self.baseline = None
+
+    def evaluate(self, scenarios):
+        """
+        scenarios: {scenario name: [OfferingEdit]}
+        :return: [result] in scenario order, each with the scenario's conflicts,
+        'delta' against the baseline, requests 'displaced' by its edits and the
+        'course_deltas' of every course whose conflicts changed
+        """
+        global _base_schedule_data
+        tasks = [(None, [])] + list(scenarios.items())
+        _base_schedule_data = self.schedule_data
+        # objects moved to the permanent generation are not written to by the
+        # collector, so the forked processes share their pages
+        gc.freeze()
+        try:
+            # every scenario gets a fresh fork of the loaded data
+            with multiprocessing.get_context("fork").Pool(self.processes, maxtasksperchild=1) as pool:
+                results = pool.starmap(_evaluate_scenario,
+                                       [(name, edits, self.seed, self.repair_time) for name, edits in tasks],
+                                       chunksize=1)
+        finally:
+            gc.unfreeze()
+            _base_schedule_data = None
+
+        self.baseline = results[0]
+        baseline_conflicts = self.baseline['course_conflicts']
+        for result in results[1:]:
+            course_conflicts = result['course_conflicts']
+            result['delta'] = result['conflicts'] - self.baseline['conflicts']
+            result['course_deltas'] = {
+                course_name: course_conflicts.get(course_name, 0) - baseline_conflicts.get(course_name, 0)
+                for course_name in sorted(set(course_conflicts) | set(baseline_conflicts))
+                if course_conflicts.get(course_name, 0) != baseline_conflicts.get(course_name, 0)}
+        return results[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the conflicts of PCO what-if scenarios")
+    parser.add_argument("scenarios", help="CSV of Scenario, Course Lookup, Semester, Period, Sections, Max rows")
+    parser.add_argument("--warm-start", default=None,
+                        help="schedule to evaluate the scenarios against, otherwise each scenario schedules the year")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repair-time", type=float, default=0, help="seconds of repair per scenario")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    current_directory = os.path.dirname(os.path.abspath(__file__))
+    schedule_data = load_scheduling_data(os.path.join(current_directory, ".."),
+                                         os.path.join(current_directory, "..", ".schedule_cache"))
+    if args.warm_start is not None:
+        schedule_data.input_prior_schedule(args.warm_start)
+    runner = ScenarioRunner(schedule_data, args.seed, args.repair_time, args.processes)
+    results = runner.evaluate(read_scenarios(args.scenarios))
+
+    print("Baseline: {} conflicts".format(runner.baseline['conflicts']))
+    for result in results:
+        print("{}: {} conflicts ({:+d}), {} requests displaced".format(
+            result['scenario'], result['conflicts'], result['delta'], result['displaced']))
+        for course_name, delta in result['course_deltas'].items():
+            print("    {} {:+d}".format(course_name, delta))
+
+
+if __name__ == "__main__":
+    main()
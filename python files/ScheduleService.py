@@ -0,0 +1,235 @@
+from ScheduleCache import load_scheduling_data
+from SchedulingData import SchedulingData
+from SchedulingAlgorithm import ScheduleCourses, ScheduleRepair
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+import numpy as np
+
+# Long-running scheduling service. The inputs are loaded once and kept
+# resident; jobs arrive as JSON lines over a Unix domain socket. Queries are
+# answered from the resident data on the event loop, scheduling runs in a
+# process pool whose workers were forked with the same data, so a job only
+# sends the current assignment array and gets the new one back
+#
+# Jobs, one JSON object per line, answered with {"ok": true, "result": ...}
+# or {"ok": false, "error": ...}; an "id" in the job is echoed back
+#   {"op": "schedule", "seed": 0, "repair_time": 0, "from_scratch": true}
+#   {"op": "reschedule_student", "student": "12345", "seed": 0}
+#   {"op": "student_schedule", "student": "12345"}
+#   {"op": "offering_fill", "course": "CompSci 110"}
+
+
+# the resident SchedulingData, inherited by the forked workers
+_service_schedule_data = None
+
+
+def check_job_parameters(job):
+    """Raises TypeError or ValueError for a job parameter a scheduling worker or query could not use"""
+    seed = job.get('seed')
+    if seed is not None:
+        if not isinstance(seed, int) or isinstance(seed, bool):
+            raise TypeError("seed must be an integer or null, not {}".format(type(seed).__name__))
+        if seed < 0:
+            raise ValueError("seed must not be negative")
+    repair_time = job.get('repair_time', 0)
+    if not isinstance(repair_time, (int, float)) or isinstance(repair_time, bool):
+        raise TypeError("repair_time must be a number of seconds, not {}".format(type(repair_time).__name__))
+    if not 0 <= repair_time < float('inf'):
+        raise ValueError("repair_time must be a finite number of seconds, 0 or more")
+    if not isinstance(job.get('from_scratch', True), bool):
+        raise TypeError("from_scratch must be true or false, not {}".format(type(job['from_scratch']).__name__))
+    for key in ('student', 'course'):
+        if key in job and not isinstance(job[key], str):
+            raise TypeError("{} must be a string, not {}".format(key, type(job[key]).__name__))
+
+
+def _run_schedule_job(assignments, request_ids, seed, repair_time):
+    """
+    Schedules in a worker starting from the parent's assignments
+    request_ids: requests to unassign and schedule again, every unscheduled request when None
+    :return: (assignment array after scheduling, number of conflicts)
+    """
+    schedule_data = _service_schedule_data
+    schedule_data.clear_assignments()
+    schedule_data.apply_assignment_array(assignments)
+    scheduler = ScheduleCourses(schedule_data, seed, verbose=False)
+    if request_ids is not None:
+        for request_id in request_ids:
+            schedule_data.unassign_student_from_course(schedule_data.course_requests.get_request(request_id))
+        scheduler.create_unscheduled_priority_queue(request_ids)
+    scheduler.match_courses_greedy_algorithm()
+    schedule_conflict = scheduler.schedule_conflict
+    if repair_time > 0:
+        schedule_conflict = ScheduleRepair(schedule_data, repair_time, verbose=False).repair_conflicts(
+            schedule_conflict)
+    return schedule_data.get_assignment_array(), len(schedule_conflict)
+
+
+class ScheduleService:
+    """Answers jobs on a Unix domain socket from a resident SchedulingData"""
+
+    def __init__(self, schedule_data: SchedulingData, socket_path, processes=None):
+        """processes: scheduling worker processes, defaults to the number of CPUs"""
+        self.schedule_data = schedule_data
+        self.socket_path = socket_path
+        self.processes = processes
+        self.pool = None
+        # scheduling jobs start from the current assignments, so they run one at a time
+        self.schedule_lock = None
+        self.operations = {
+            'schedule': self.schedule,
+            'reschedule_student': self.reschedule_student,
+            'student_schedule': self.student_schedule,
+            'offering_fill': self.offering_fill,
+        }
+
+    def serve(self):
+        """Runs until the process receives SIGINT or SIGTERM"""
+        global _service_schedule_data
+        _service_schedule_data = self.schedule_data
+        # the workers are forked before the event loop starts any threads
+        with multiprocessing.get_context("fork").Pool(self.processes) as self.pool:
+            try:
+                asyncio.run(self.serve_socket())
+            finally:
+                if os.path.exists(self.socket_path):
+                    os.remove(self.socket_path)
+
+    async def serve_socket(self):
+        self.schedule_lock = asyncio.Lock()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_connection, path=self.socket_path)
+        print("Scheduling service listening on", self.socket_path)
+        async with server:
+            await stop.wait()
+        print("Scheduling service stopped")
+
+    async def handle_connection(self, reader, writer):
+        """Answers each job line of a connection in order"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle_job(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_job(self, line):
+        start = time.perf_counter()
+        job_id = None
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise TypeError("A job must be a JSON object, not {}".format(type(job).__name__))
+            job_id = job.get('id')
+            if job.get('op') not in self.operations:
+                raise ValueError("Unknown op {}, expected one of {}".format(job.get('op'), sorted(self.operations)))
+            # checked here so a bad parameter is not found only after a worker has scheduled
+            check_job_parameters(job)
+            response = {'ok': True, 'result': await self.operations[job['op']](job)}
+        except (ValueError, KeyError, TypeError) as error:
+            # the message of a KeyError is the key, which str() would quote
+            response = {'ok': False, 'error': "{}: {}".format(type(error).__name__,
+                                                              error.args[0] if error.args else error)}
+        response['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        if job_id is not None:
+            response['id'] = job_id
+        return response
+
+    async def run_in_pool(self, request_ids, seed, repair_time, from_scratch=False):
+        """Runs a scheduling job in the pool and applies the changed assignments to the resident data"""
+        async with self.schedule_lock:
+            schedule_data = self.schedule_data
+            current = schedule_data.get_assignment_array()
+            start = np.full_like(current, -1) if from_scratch else current
+            loop = asyncio.get_running_loop()
+            assignments, conflicts = await loop.run_in_executor(
+                None, self.pool.apply, _run_schedule_job, (start, request_ids, seed, repair_time))
+            changed = np.flatnonzero(assignments != current)
+            requests = schedule_data.course_requests.requests
+            for request_id in changed.tolist():
+                schedule_data.unassign_student_from_course(requests[request_id])
+            schedule_data.apply_assignment_array(np.where(assignments != current, assignments, -1))
+            return {'conflicts': conflicts, 'requests_changed': len(changed)}
+
+    async def schedule(self, job):
+        """Schedules the unscheduled requests, or the whole year again with from_scratch"""
+        return await self.run_in_pool(None, job.get('seed'), job.get('repair_time', 0), job.get('from_scratch', True))
+
+    async def reschedule_student(self, job):
+        """Unassigns one student's requests and schedules them again around everyone else"""
+        request_ids = self.schedule_data.course_requests.by_student.get(job['student'])
+        if request_ids is None:
+            raise KeyError("Unknown student {}".format(job['student']))
+        result = await self.run_in_pool(request_ids, job.get('seed'), 0)
+        result['schedule'] = await self.student_schedule(job)
+        return result
+
+    async def student_schedule(self, job):
+        """The student's requests with their semester and period, blank while unscheduled"""
+        period_grid = self.schedule_data.period_grid
+        requests = self.schedule_data.course_requests.get_student_requests(job['student'])
+        if not requests:
+            raise KeyError("Unknown student {}".format(job['student']))
+        return [{'course': request.course_name,
+                 'semester': "" if request.assigned_course is None else
+                 period_grid.semester_names[request.assigned_course.semester],
+                 'period': "" if request.assigned_course is None else
+                 period_grid.period_labels[request.assigned_course.period]}
+                for request in requests]
+
+    async def offering_fill(self, job):
+        """Enrolled students and seats of each semester/period a course is offered in"""
+        period_grid = self.schedule_data.period_grid
+        if job['course'] not in self.schedule_data.course_data.courses:
+            raise KeyError("Unknown course {}".format(job['course']))
+        return [{'semester': period_grid.semester_names[offering.semester],
+                 'period': period_grid.period_labels[offering.period],
+                 'enrolled': len(offering.students_enrolled), 'seats': offering.number_seats_total}
+                for offering in self.schedule_data.course_data.get_course_capacity(job['course']).offerings]
+
+
+def send_job(socket_path, job):
+    """Sends one job to a running service and returns its response"""
+    async def exchange():
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write(json.dumps(job).encode() + b"\n")
+        await writer.drain()
+        response = await reader.readline()
+        writer.close()
+        await writer.wait_closed()
+        return json.loads(response)
+    return asyncio.run(exchange())
+
+
+def main():
+    current_directory = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Keep the scheduling data loaded and answer jobs on a socket")
+    parser.add_argument("--socket", default=os.path.join(current_directory, "..", ".schedule_service.sock"))
+    parser.add_argument("--processes", type=int, default=None, help="scheduling worker processes")
+    parser.add_argument("--warm-start", default=None, help="schedule to start from, e.g. Schedule Data.csv")
+    parser.add_argument("--no-cache", action="store_true", help="always re-read the CSV inputs")
+    args = parser.parse_args()
+
+    schedule_data = load_scheduling_data(os.path.join(current_directory, ".."),
+                                         None if args.no_cache else os.path.join(current_directory, "..", ".schedule_cache"))
+    if args.warm_start is not None:
+        schedule_data.input_prior_schedule(args.warm_start)
+    ScheduleService(schedule_data, args.socket, args.processes).serve()
+
+
+if __name__ == "__main__":
+    main()
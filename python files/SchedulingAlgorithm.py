@@ -1,38 +1,408 @@
 from SchedulingData import SchedulingData, StudentCourseRequest, CourseOffering
-from queue import PriorityQueue
+from ScheduleMetrics import phase_timer
+from collections import deque
+from functools import partial
+import heapq
+import multiprocessing
 import random
+import time
+import numpy as np
 
-#TODO: Need to handle double periods
 #TODO: Need to handle multi-day courses (Athletes) IC-M, IC-T courses and all atheletes add as a required course
 #TODO: Scan course requests- build #sections/course based on min enrollment numbers - assign sections to random (or not) periods
 #TODO: adapt method to schedule all courses at the same time rather than by semester (student request by course, not course-semester)
+class SchedulerQueue:
+    """
+    Min-heap of request ids with lazy decrease-key
+    heap entries are (objective, tie_break, request_id); re-prioritizing a
+    request pushes a new entry and the stale one is skipped when popped
+    self.priority{request_id} <- current objective of every queued request
+    """
+    def __init__(self):
+        self.heap = []
+        self.priority = {}
+
+    def __len__(self):
+        return len(self.priority)
+
+    def __contains__(self, request_id):
+        return request_id in self.priority
+
+    def load(self, objective_values, request_ids):
+        """Replaces the queue contents with the given requests in one heapify"""
+        objective_values = objective_values.tolist()
+        request_ids = request_ids.tolist()
+        self.priority = dict(zip(request_ids, objective_values))
+        self.heap = list(zip(objective_values, request_ids, request_ids))
+        heapq.heapify(self.heap)
+
+    def push(self, request_id, objective_value):
+        self.priority[request_id] = objective_value
+        heapq.heappush(self.heap, (objective_value, request_id, request_id))
+
+    def pop(self):
+        """Removes and returns the queued request id with the lowest objective"""
+        while self.heap:
+            objective_value, tie_break, request_id = heapq.heappop(self.heap)
+            if self.priority.get(request_id) == objective_value:
+                del self.priority[request_id]
+                return request_id
+        raise IndexError("pop from an empty SchedulerQueue")
+
+
+class MinCostFlow:
+    """
+    Min-cost max-flow on a small directed graph by the primal-dual method
+    Each phase runs Dijkstra with node potentials, which keeps the reduced
+    costs non-negative, and then sends a blocking flow along every shortest
+    path at once. Costs are small integers in the scheduler so only a few
+    phases are needed. Edge costs must be non-negative integers when added.
+    Edges are stored in pairs; edge ^ 1 is the residual edge and its
+    capacity is the flow sent
+    """
+    def __init__(self, number_nodes):
+        self.number_nodes = number_nodes
+        self.graph = [[] for _ in range(number_nodes)] # node -> [edge]
+        self.edge_target = []
+        self.edge_capacity = []
+        self.edge_cost = []
+        self.potential = [0] * number_nodes
+
+    def add_edge(self, source, target, capacity, cost):
+        edge = len(self.edge_target)
+        self.graph[source].append(edge)
+        self.edge_target.append(target)
+        self.edge_capacity.append(capacity)
+        self.edge_cost.append(cost)
+        self.graph[target].append(edge + 1)
+        self.edge_target.append(source)
+        self.edge_capacity.append(0)
+        self.edge_cost.append(-cost)
+        return edge
+
+    def get_flow(self, edge):
+        return self.edge_capacity[edge ^ 1]
+
+    def solve(self, source, sink):
+        """
+        Sends the maximum flow from source to sink at minimum cost
+        :return: (total flow, total cost)
+        """
+        total_flow = 0
+        total_cost = 0
+        while self.update_potentials(source, sink):
+            path_flow, path_cost = self.send_blocking_flow(source, sink)
+            total_flow += path_flow
+            total_cost += path_cost
+        return total_flow, total_cost
+
+    def update_potentials(self, source, sink):
+        """Dijkstra on reduced costs; returns False when the sink is unreachable"""
+        graph = self.graph
+        edge_target = self.edge_target
+        edge_capacity = self.edge_capacity
+        edge_cost = self.edge_cost
+        potential = self.potential
+        distance = [None] * self.number_nodes
+        distance[source] = 0
+        heap = [(0, source)]
+        while heap:
+            node_distance, node = heapq.heappop(heap)
+            if node_distance > distance[node]:
+                continue
+            for edge in graph[node]:
+                if edge_capacity[edge] > 0:
+                    target = edge_target[edge]
+                    target_distance = node_distance + edge_cost[edge] + potential[node] - potential[target]
+                    if distance[target] is None or target_distance < distance[target]:
+                        distance[target] = target_distance
+                        heapq.heappush(heap, (target_distance, target))
+        if distance[sink] is None:
+            return False
+        for node in range(self.number_nodes):
+            if distance[node] is not None:
+                potential[node] += distance[node]
+        return True
+
+    def send_blocking_flow(self, source, sink):
+        """
+        Augments along shortest paths only, i.e. edges with zero reduced cost,
+        Dinic style with BFS levels so the admissible graph has no cycles
+        :return: (flow sent, cost of the flow)
+        """
+        graph = self.graph
+        edge_target = self.edge_target
+        edge_capacity = self.edge_capacity
+        edge_cost = self.edge_cost
+        potential = self.potential
+        total_flow = 0
+        total_cost = 0
+        while True:
+            level = [-1] * self.number_nodes
+            level[source] = 0
+            queue = [source]
+            for node in queue:
+                for edge in graph[node]:
+                    target = edge_target[edge]
+                    if edge_capacity[edge] > 0 and level[target] < 0 and \
+                            edge_cost[edge] + potential[node] - potential[target] == 0:
+                        level[target] = level[node] + 1
+                        queue.append(target)
+            if level[sink] < 0:
+                return total_flow, total_cost
+
+            current_edge = [0] * self.number_nodes
+            while True:
+                path = []
+                node = source
+                while node != sink:
+                    edges = graph[node]
+                    while current_edge[node] < len(edges):
+                        edge = edges[current_edge[node]]
+                        target = edge_target[edge]
+                        if edge_capacity[edge] > 0 and level[target] == level[node] + 1 and \
+                                edge_cost[edge] + potential[node] - potential[target] == 0:
+                            break
+                        current_edge[node] += 1
+                    else:
+                        # dead end, retreat and skip the edge that led here
+                        if node == source:
+                            break
+                        level[node] = -1
+                        edge = path.pop()
+                        node = edge_target[edge ^ 1]
+                        current_edge[node] += 1
+                        continue
+                    path.append(edge)
+                    node = target
+                if node != sink:
+                    break
+                path_flow = min(edge_capacity[edge] for edge in path)
+                for edge in path:
+                    edge_capacity[edge] -= path_flow
+                    edge_capacity[edge ^ 1] += path_flow
+                    total_cost += path_flow * edge_cost[edge]
+                total_flow += path_flow
+
+
 class ScheduleCourses:
 
-    def __init__(self, schedule_data: SchedulingData):
+    def __init__(self, schedule_data: SchedulingData, seed=None, verbose=True, metrics=None, seat_share=1.0,
+                 checkpoint=None, checkpoint_interval=5.0, prerequisite_priority=3):
+        """
+        seed: seeds the priority jitter so a run can be reproduced; when None
+        the jitter is drawn from the random module
+        verbose: print per-conflict and summary messages
+        metrics: ScheduleMetrics to record the greedy loop's counters in, None disables them
+        seat_share: fraction of each course's seats this run is given, the seat
+        score thresholds are for a course's full seats
+        checkpoint: ScheduleCheckpoint with get_checkpoint_fields the greedy
+        loop saves its state to, or None
+        checkpoint_interval: seconds between checkpoints
+        prerequisite_priority: exponent of the share of semesters a request
+        ordered by prerequisites may use in its score, so higher values schedule
+        those requests sooner. Averaged over seeds on the shipped data 0 gives
+        about 1090 greedy conflicts, 1 about 1060 and 2 to 4 about 1040
+        """
         self.schedule_data = schedule_data
-        self.unscheduled_priority_queue: PriorityQueue = PriorityQueue()
+        self.seed = seed
+        self.prerequisite_priority = prerequisite_priority
+        self.seat_share = seat_share
+        self.verbose = verbose
+        self.metrics = metrics
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.unscheduled_priority_queue = SchedulerQueue()
+        self.queue_built = False
+        self.pops = 0
+        self.number_to_schedule = None
         self.schedule_conflict = []
+        # per-request score components kept for re-scoring as courses fill
+        self.request_base_score = None
+        self.request_jitter = None
+        self.course_seats_available = {}
+        self.course_seat_score = {}
+        self.greedy_gap = None # (conflicts, load imbalance) of min-cost flow minus greedy
+        # per interned course: seats available by semester/period and unscheduled requests, set by the pre-flight
+        self.course_supply = None
+        self.course_demand = None
+
+    def score_course_requests(self, request_ids):
+        """
+        Scores a batch of requests in one vectorized pass
+        Students and courses are the interned ids of the request store so
+        each student's busy periods and each course's density are computed
+        once rather than once per request. The seat term uses the seats still
+        available so it can be refreshed by rescore_course as the course fills
+        :param request_ids: numpy array of request ids
+        :return: numpy array of objective values (lower is scheduled first)
+        """
+        course_requests = self.schedule_data.course_requests
+        course_data = self.schedule_data.course_data
+        request_student = np.frombuffer(course_requests.request_student, dtype=np.int32)
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+
+        # per-course contact hours, offered periods and seats (num_periods, #seats)
+        course_contact = np.array([course_data.courses[course_name].contact
+                                   for course_name in course_requests.course_names], dtype=np.float64)
+        class_density = np.array([course_data.get_number_periods_and_students(course_name)
+                                  for course_name in course_requests.course_names],
+                                 dtype=np.float64).reshape(-1, 2)
+        course_seats = course_data.get_supply_matrix(course_requests.course_names).sum(axis=1)
+        for course_name, seats in zip(course_requests.course_names, course_seats.tolist()):
+            self.course_seats_available[course_name] = seats
+            self.course_seat_score[course_name] = self.normalize_number_seats(seats / self.seat_share)
+        class_density[:, 1] = course_seats
+
+        # busy periods are summed over all of a student's requests, scheduled or not
+        busy_periods = np.bincount(request_student, weights=course_contact[request_course],
+                                   minlength=len(course_requests.student_names))
+        student_free_periods = self.schedule_data.period_grid.number_slots - busy_periods[request_student[request_ids]]
+        courses = request_course[request_ids]
+        jitter = np.random.default_rng(
+            random.getrandbits(64) if self.seed is None else self.seed).random(len(request_ids))
+        base_score = self.normalize_student_flexibility(student_free_periods) * \
+            self.normalize_number_course_periods_to_min(class_density[courses, 0],
+                                                        self.schedule_data.period_grid.number_periods) * \
+            self.normalize_allowed_fraction(
+                self.schedule_data.prerequisites.get_allowed_fraction(len(course_requests))[request_ids])
+
+        self.request_base_score = np.zeros(len(course_requests))
+        self.request_jitter = np.zeros(len(course_requests))
+        self.request_base_score[request_ids] = base_score
+        self.request_jitter[request_ids] = jitter
+        return base_score * self.normalize_number_seats(class_density[courses, 1] / self.seat_share) + 0.01*jitter
+
+    def prune_infeasible_requests(self, request_ids):
+        """
+        Pre-flight comparison of the seats offered with the requests for each
+        course. Requests for a course with no seats available in any
+        semester/period cannot be scheduled, so they go straight to
+        schedule_conflict instead of through the greedy loop
+        :param request_ids: numpy array of unscheduled request ids
+        :return: numpy array of the request ids that may still be scheduled
+        """
+        course_requests = self.schedule_data.course_requests
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+        self.course_supply = self.schedule_data.course_data.get_supply_matrix(course_requests.course_names)
+        self.course_demand = np.bincount(request_course[request_ids], minlength=len(course_requests.course_names))
+        seats = self.course_supply.sum(axis=1)
+
+        unoffered = np.flatnonzero((seats == 0) & (self.course_demand > 0))
+        oversubscribed = np.flatnonzero((seats > 0) & (self.course_demand > seats))
+        if self.verbose:
+            for course_id in unoffered.tolist():
+                print("No course period available for {} ({} requests)".format(
+                    course_requests.course_names[course_id], self.course_demand[course_id]))
+            for course_id in oversubscribed.tolist():
+                print("Oversubscribed: {} has {} requests for {} seats".format(
+                    course_requests.course_names[course_id], self.course_demand[course_id], seats[course_id]))
+
+        infeasible = seats[request_course[request_ids]] == 0
+        requests = course_requests.requests
+        self.schedule_conflict.extend(requests[request_id] for request_id in request_ids[infeasible].tolist())
+        if self.metrics is not None:
+            # courses that are offered but already full count as full
+            offered = np.array([self.schedule_data.course_data.get_course_capacity(course_name).number_seats > 0
+                                for course_name in course_requests.course_names], dtype=bool)
+            full = offered[request_course[request_ids[infeasible]]]
+            self.metrics.record_conflict("no offering", int((~full).sum()))
+            self.metrics.record_conflict("seats full", int(full.sum()))
+            self.metrics.count("oversubscribed courses", len(oversubscribed))
+        return request_ids[~infeasible]
+
+    def create_unscheduled_priority_queue(self, request_ids=None):
+        """
+        request_ids: schedule only these unscheduled requests, every unscheduled
+        request when None
+        """
+        # sorted so the jitter drawn for each request does not depend on the
+        # order requests were returned to the unscheduled set
+        if request_ids is None:
+            request_ids = self.schedule_data.course_requests.unscheduled.keys()
+        request_ids = np.sort(np.fromiter(request_ids, dtype=np.int64))
+        request_ids = self.prune_infeasible_requests(request_ids)
+        objective_values = self.score_course_requests(request_ids)
+        # request ids break ties without comparing requests
+        self.unscheduled_priority_queue.load(objective_values, request_ids)
+        self.queue_built = True
+
+    @staticmethod
+    def get_checkpoint_fields(schedule_data: SchedulingData):
+        """Layout of a greedy run's checkpoint, see ScheduleCheckpoint"""
+        number_requests = len(schedule_data.course_requests)
+        return {
+            'assignments': (np.int16, number_requests),
+            'queue_ids': (np.int64, number_requests),
+            'queue_values': (np.float64, number_requests),
+            'conflicts': (np.int64, number_requests),
+            'base_score': (np.float64, number_requests),
+            'jitter': (np.float64, number_requests),
+            'course_seats': (np.int64, len(schedule_data.course_requests.course_names)),
+            'progress': (np.int64, 2), # pops, requests to schedule
+        }
+
+    def get_checkpoint_state(self):
+        """
+        State of the greedy loop between two pops. The jitter was drawn when
+        the queue was built, so the saved scores stand in for the random state
+        """
+        queue = self.unscheduled_priority_queue.priority
+        return {
+            'assignments': self.schedule_data.get_assignment_array(),
+            'queue_ids': np.fromiter(queue.keys(), dtype=np.int64, count=len(queue)),
+            'queue_values': np.fromiter(queue.values(), dtype=np.float64, count=len(queue)),
+            'conflicts': np.array([request.request_id for request in self.schedule_conflict], dtype=np.int64),
+            'base_score': self.request_base_score,
+            'jitter': self.request_jitter,
+            'course_seats': np.array([self.course_seats_available[course_name]
+                                      for course_name in self.schedule_data.course_requests.course_names],
+                                     dtype=np.int64),
+            'progress': np.array([self.pops, self.number_to_schedule], dtype=np.int64),
+        }
 
-    def create_unscheduled_priority_queue(self):
-        self.unscheduled_priority_queue.empty()
-        for unscheduled_item in self.schedule_data.unscheduled_course_requests:
-            class_density = self.schedule_data.course_data.get_number_periods_and_students(
-                    unscheduled_item.course_name) #(num_periods, #seats)
-            student_courses = self.schedule_data.student_lookup.students[unscheduled_item.student_name]['requests']          
-            busy_periods = 0
-            for course in student_courses:
-                busy_periods += \
-                self.schedule_data.course_data.courses[course.course_name].contact
-            student_free_periods = 24 - busy_periods
-            objective_value = self.normalize_student_flexibility(student_free_periods) * \
-                              self.normalize_number_course_periods_to_min(class_density[0]) * \
-                              self.normalize_number_seats(class_density[1]) + 0.01*random.random()
-            pqItem = (objective_value, unscheduled_item)
-            # print(pqItem) # for debugging
-            self.unscheduled_priority_queue.put(pqItem)
+    def resume_from_checkpoint(self, state):
+        """
+        Restores the state saved by get_checkpoint_state so that
+        match_courses_greedy_algorithm continues the run where it stopped
+        """
+        course_requests = self.schedule_data.course_requests
+        self.schedule_data.clear_assignments()
+        self.schedule_data.apply_assignment_array(state['assignments'])
+        self.unscheduled_priority_queue.load(state['queue_values'], state['queue_ids'])
+        self.schedule_conflict = [course_requests.requests[request_id] for request_id in state['conflicts'].tolist()]
+        self.request_base_score = state['base_score']
+        self.request_jitter = state['jitter']
+        self.course_seats_available = dict(zip(course_requests.course_names, state['course_seats'].tolist()))
+        self.course_seat_score = {course_name: self.normalize_number_seats(seats / self.seat_share)
+                                  for course_name, seats in self.course_seats_available.items()}
+        self.pops, self.number_to_schedule = state['progress'].tolist()
+        self.queue_built = True
+
+    def rescore_course(self, course_name):
+        """
+        Refreshes the seat term of a course's queued requests once its
+        available seats cross one of the normalize_number_seats thresholds
+        """
+        seat_score = self.normalize_number_seats(self.course_seats_available[course_name] / self.seat_share)
+        if seat_score == self.course_seat_score[course_name]:
+            return
+        self.course_seat_score[course_name] = seat_score
+        queue = self.unscheduled_priority_queue
+        request_ids = [request_id for request_id in self.schedule_data.course_requests.by_course[course_name]
+                       if request_id in queue]
+        objective_values = self.request_base_score[request_ids] * seat_score + \
+            0.01*self.request_jitter[request_ids]
+        for request_id, objective_value in zip(request_ids, objective_values.tolist()):
+            queue.push(request_id, objective_value)
+
+    # The normalize_* functions accept a scalar or a numpy array of values
 
     @staticmethod
     def normalize_number_courses_student_to_min(number_classes):
+        if isinstance(number_classes, np.ndarray):
+            return np.where(number_classes > 14, 0,
+                            np.where(number_classes <= 9, 1, (15 - number_classes) / 9))
         if number_classes > 14:
             return 0
         if number_classes <= 9:
@@ -42,6 +412,8 @@ class ScheduleCourses:
     @staticmethod
     def normalize_student_flexibility(free_periods):
         # Alt 
+        if isinstance(free_periods, np.ndarray):
+            return np.clip(free_periods / 15, 0, 1)
         if free_periods <= 0:
             return 0
         elif free_periods >= 15:
@@ -50,11 +422,17 @@ class ScheduleCourses:
             return (free_periods / 15)
 
     @staticmethod
-    def normalize_number_course_periods_to_min(number_periods):
-        return (number_periods - 1) / 8 + 0.01
+    def normalize_number_course_periods_to_min(number_periods, grid_periods=8):
+        return (number_periods - 1) / grid_periods + 0.01
+
+    def normalize_allowed_fraction(self, allowed_fraction):
+        # requests ordered by prerequisites can use fewer semesters, so they are scheduled sooner
+        return allowed_fraction ** self.prerequisite_priority
 
     @staticmethod
     def normalize_number_seats(number_seats):
+        if isinstance(number_seats, np.ndarray):
+            return np.where(number_seats < 30, 0.1, np.where(number_seats < 100, 0.5, 1))
         if number_seats < 30:
             return 0.1
         if number_seats < 100:
@@ -63,86 +441,708 @@ class ScheduleCourses:
 
     def match_courses_greedy_algorithm(self):
         # capture initial amount for reporting
-        number_courses_to_schedule = len(self.schedule_data.unscheduled_course_requests)
-        # create priority queue for order of challenging schedules
-        self.create_unscheduled_priority_queue()
-
-        while self.unscheduled_priority_queue.qsize() > 0:
-            course_to_schedule: StudentCourseRequest = self.unscheduled_priority_queue.get()[1]
-            # Find which periods are available: [(semester, period)]
-            available_periods = self.schedule_data.course_data.get_course_periods_available(
-                course_to_schedule.course_name)
-            if len(available_periods) == 0:
-                print("No course period available for",course_to_schedule.course_name)
+        if self.number_to_schedule is None:
+            self.number_to_schedule = len(self.schedule_data.unscheduled_course_requests)
+        number_courses_to_schedule = self.number_to_schedule
+        # create priority queue for order of challenging schedules, unless the
+        # caller has already built it or it was restored from a checkpoint
+        if not self.queue_built:
+            with phase_timer(self.metrics, "create_unscheduled_priority_queue"):
+                self.create_unscheduled_priority_queue()
+
+        requests = self.schedule_data.course_requests.requests
+        prerequisites = self.schedule_data.prerequisites
+        course_data = self.schedule_data.course_data
+        metrics = self.metrics
+        checkpoint = self.checkpoint
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        pops = self.pops
+        while len(self.unscheduled_priority_queue) > 0:
+            # checkpoints are taken between pops, when no request is half placed
+            if checkpoint is not None and pops % 256 == 0 and time.monotonic() >= next_checkpoint:
+                self.pops = pops
+                checkpoint.save(self.get_checkpoint_state())
+                next_checkpoint = time.monotonic() + self.checkpoint_interval
+            course_to_schedule: StudentCourseRequest = requests[self.unscheduled_priority_queue.pop()]
+            pops += 1
+            # Find which offerings are available (precomputed per course)
+            course_offerings = course_data.get_course_capacity(course_to_schedule.course_name).offerings
+            if metrics is not None:
+                metrics.count("candidate periods examined", len(course_offerings))
+                if pops % metrics.fill_sample_interval == 0:
+                    metrics.sample_fill(pops, self.schedule_data.course_data)
+            if len(course_offerings) == 0:
+                if self.verbose:
+                    print("No course period available for",course_to_schedule.course_name)
+                if metrics is not None:
+                    metrics.record_conflict("no offering")
                 self.schedule_conflict.append(course_to_schedule)
                 continue
 
-            # eliminate periods from the available list: [(semester, period)]
-            scheduled_periods = self.schedule_data.student_lookup.list_periods_scheduled(
-                course_to_schedule.student_name)
-                
-            # Include artificial periods in scheduled periods to avoid double period conflicts
-            # If scheduled period is odd then add an artificial period before 
-            # For example, if period 1 (M2) then add artificial in 0 (M1)
-            if self.schedule_data.course_data.courses[course_to_schedule.course_name].contact == 2:
-                to_add = []
-                for period in scheduled_periods:
-                    if period[1] % 2 == 1:
-                        to_add.append((period[0], period[1]-1))
-                        
+            # offerings that are full or overlap the student's schedule are left
+            # out; the mask covers both halves of double periods and, for requests
+            # ordered by prerequisites, the semesters they may not use. Of the
+            # rest the student's least loaded semester is picked to distribute
+            # their course load across trimesters, then its period with the most
+            # seats, read from the seat matrix
+            student_lookup = self.schedule_data.student_lookup
+            schedule_mask = student_lookup.get_schedule_mask(course_to_schedule.student_name)
+            blocked_mask = 0
+            if course_to_schedule.request_id in prerequisites.fixed_mask:
+                blocked_mask = prerequisites.get_blocked_mask(course_to_schedule.request_id, requests)
             # create lookup of course load (TODO: ac only) by semester
-            course_load_by_semester = [0, 0, 0]
-            
-            # Remove available periods based on current schedule
-            # and calculate current course load distribution
-            for period in scheduled_periods:
-                course_load_by_semester[period[0]] += 1
-                if period in available_periods:
-                    available_periods.remove(period)
-
-            if len(available_periods) == 0:
+            course_load_by_semester = student_lookup.get_course_load_by_semester(
+                course_to_schedule.student_name)
+            slot = course_data.choose_slot(course_to_schedule.course_name, schedule_mask | blocked_mask,
+                                           course_load_by_semester)
+
+            if slot is None:
                 # no periods exist
+                if metrics is not None:
+                    # busy when every offering overlaps the schedule, otherwise the free
+                    # ones are out of prerequisite order or full
+                    free_offerings = [offering for offering in course_offerings
+                                      if not offering.period_mask & schedule_mask]
+                    if not free_offerings:
+                        metrics.record_conflict("student busy")
+                    elif all(offering.period_mask & blocked_mask for offering in free_offerings):
+                        metrics.record_conflict("prerequisite order")
+                    else:
+                        metrics.record_conflict("seats full")
                 self.schedule_conflict.append(course_to_schedule)
                 continue
-            
-            # create a list of best choices for each semester
-            # best choice is the one with most seats available
-            # list values are (period, seats available) tuples
-            available_by_semester = [None, None, None]
-            for period in available_periods:
-                seats = self.schedule_data.course_data.lookupByPeriod[
-                period[0]][period[1]][course_to_schedule.course_name].number_seats_available()
-                
-                if available_by_semester[period[0]] is None:
-                    available_by_semester[period[0]] = (period[1], seats)
-                elif seats > available_by_semester[period[0]][1]:
-                    available_by_semester[period[0]] = (period[1], seats)
-                
-            # pick a course that distributes their course load across trimesters
-            # and then the period with the most seats available
-            period = None
-            for i in range(len(available_by_semester)):
-                if available_by_semester[i] is None:
-                    continue
-                if period is None:
-                    # first semester with an available course
-                    period = (i, available_by_semester[i][0])
-                elif course_load_by_semester[i] < course_load_by_semester[period[0]]:
-                    # current semester load is less than current best choice
-                    period = (i, available_by_semester[i][0])
-                elif course_load_by_semester[i] == course_load_by_semester[period[0]] and \
-                available_by_semester[i][1] > available_by_semester[period[0]][1]:
-                    # current semester load is same as current best choice but
-                    # current availability is better than current best choice
-                    period = (i, available_by_semester[i][0])
-
-            course_offering: CourseOffering = self.schedule_data.course_data.lookupByPeriod[
-                period[0]][period[1]][course_to_schedule.course_name]
+
+            course_offering: CourseOffering = course_data.lookupByPeriod[slot[0]][slot[1]][
+                course_to_schedule.course_name]
             self.schedule_data.assign_student_to_course(course_to_schedule, course_offering)
+            self.course_seats_available[course_to_schedule.course_name] -= 1
+            self.rescore_course(course_to_schedule.course_name)
 
         # print("Scheduler Completed.  {} courses scheduled, {} conflicts were unresolved".format(
             # number_courses_to_schedule, self.unscheduled_priority_queue.qsize()))
+        self.pops = pops
+        if checkpoint is not None:
+            checkpoint.save(self.get_checkpoint_state())
+        if metrics is not None:
+            metrics.count("pops processed", pops)
+            metrics.count("requests scheduled", number_courses_to_schedule - len(self.schedule_conflict))
+            metrics.sample_fill(pops, self.schedule_data.course_data)
             
-        print("Scheduler Completed.  {} courses scheduled, {} conflicts were unresolved".format(
-            number_courses_to_schedule-len(self.schedule_conflict), len(self.schedule_conflict)))
+        if self.verbose:
+            print("Scheduler Completed.  {} courses scheduled, {} conflicts were unresolved".format(
+                number_courses_to_schedule-len(self.schedule_conflict), len(self.schedule_conflict)))
+
+    def match_courses_min_cost_flow(self, report_gap=True):
+        """
+        Schedules one course at a time as a min-cost flow: requests are the
+        sources, each offering's available seats cap its edge to the sink and
+        a request's edge to an offering costs the student's current load in
+        that semester, the same trimester balance the greedy loop uses.
+        Courses are taken in order of their requests' mean priority score.
+        Requests the flow cannot route, because the student is busy in every
+        offered period or the seats run out, fall back to the greedy loop
+        report_gap: also run the greedy algorithm with the same seed and
+        report the difference in conflicts and trimester load imbalance
+        """
+        course_requests = self.schedule_data.course_requests
+        course_data = self.schedule_data.course_data
+        student_lookup = self.schedule_data.student_lookup
+        number_courses_to_schedule = len(self.schedule_data.unscheduled_course_requests)
+        # the greedy comparison starts from the same assignments, e.g. a warm start
+        initial_assignments = self.schedule_data.get_assignment_array() if report_gap else None
+
+        request_ids = np.sort(np.fromiter(course_requests.unscheduled.keys(), dtype=np.int64))
+        objective_values = self.score_course_requests(request_ids)
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)[request_ids]
+        course_totals = np.bincount(request_course, weights=objective_values, minlength=len(course_requests.course_names))
+        course_counts = np.bincount(request_course, minlength=len(course_requests.course_names))
+        course_order = np.argsort(course_totals / np.maximum(course_counts, 1), kind='stable')
+
+        number_routed = 0
+        for course_id in course_order[course_counts[course_order] > 0].tolist():
+            course_name = course_requests.course_names[course_id]
+            offerings = course_data.get_course_capacity(course_name).offerings
+            if len(offerings) == 0:
+                continue
+            # group requests by their feasible offerings and costs; a student's
+            # second request for the course is left to the greedy fallback since
+            # both would be routed against the same schedule
+            groups = {}
+            students_routed = set()
+            for request_id in course_requests.by_course[course_name]:
+                request = course_requests.requests[request_id]
+                if request.assigned_course is not None or request.student_name in students_routed:
+                    continue
+                students_routed.add(request.student_name)
+                schedule_mask = student_lookup.get_schedule_mask(request.student_name) | \
+                    self.schedule_data.prerequisites.get_blocked_mask(request_id, course_requests.requests)
+                course_load_by_semester = student_lookup.get_course_load_by_semester(request.student_name)
+                arcs = tuple((index, course_load_by_semester[offering.semester])
+                             for index, offering in enumerate(offerings)
+                             if not offering.period_mask & schedule_mask)
+                if arcs:
+                    groups.setdefault(arcs, []).append(request)
+            if not groups:
+                continue
+
+            # nodes: source, sink, one per group then one per offering
+            source, sink = 0, 1
+            flow = MinCostFlow(2 + len(groups) + len(offerings))
+            group_edges = []
+            for group_index, (arcs, requests) in enumerate(groups.items()):
+                group_node = 2 + group_index
+                flow.add_edge(source, group_node, len(requests), 0)
+                group_edges.append([(index, flow.add_edge(group_node, 2 + len(groups) + index, len(requests), cost))
+                                    for index, cost in arcs])
+            for index, offering in enumerate(offerings):
+                seats = course_data.get_seats_left(offering)
+                if seats > 0:
+                    flow.add_edge(2 + len(groups) + index, sink, seats, 0)
+            flow.solve(source, sink)
+
+            for requests, edges in zip(groups.values(), group_edges):
+                position = 0
+                for index, edge in edges:
+                    for request in requests[position:position + flow.get_flow(edge)]:
+                        self.schedule_data.assign_student_to_course(request, offerings[index])
+                        number_routed += 1
+                    position += flow.get_flow(edge)
+
+        if self.verbose:
+            print("Min-cost flow routed {} of {} requests, {} fall back to greedy".format(
+                number_routed, number_courses_to_schedule, number_courses_to_schedule - number_routed))
+        self.match_courses_greedy_algorithm()
+
+        if report_gap:
+            flow_assignments = self.schedule_data.get_assignment_array()
+            flow_conflicts = len(self.schedule_conflict)
+            flow_imbalance = self.measure_load_imbalance()
+            self.schedule_data.clear_assignments()
+            self.schedule_data.apply_assignment_array(initial_assignments)
+            greedy = ScheduleCourses(self.schedule_data, self.seed, verbose=False)
+            greedy.match_courses_greedy_algorithm()
+            greedy_conflicts = len(greedy.schedule_conflict)
+            greedy_imbalance = greedy.measure_load_imbalance()
+            self.schedule_data.clear_assignments()
+            self.schedule_data.apply_assignment_array(flow_assignments)
+            self.greedy_gap = (flow_conflicts - greedy_conflicts, flow_imbalance - greedy_imbalance)
+            print("Min-cost flow vs greedy: {} vs {} conflicts ({:+d}), load imbalance {} vs {} ({:+d})".format(
+                flow_conflicts, greedy_conflicts, self.greedy_gap[0],
+                flow_imbalance, greedy_imbalance, self.greedy_gap[1]))
+
+    def place_course_requests(self, request_ids):
+        """
+        Places a batch of unscheduled requests for one course at once, e.g. the
+        requests an offering change displaced. Each round every pending request
+        chooses its slot with CourseLookupData.choose_slots against the seats
+        left when the round starts; requests are then placed in the given order
+        while their slot has a seat and no earlier request of their student
+        was placed in the round, and the rest choose again
+        Requests with no free offering that has a seat go to schedule_conflict
+        :param request_ids: unscheduled request ids for the same course that are not in the queue
+        :return: number of requests placed
+        """
+        schedule_data = self.schedule_data
+        requests = schedule_data.course_requests.requests
+        student_lookup = schedule_data.student_lookup
+        course_data = schedule_data.course_data
+        pending = [requests[request_id] for request_id in request_ids]
+        if not pending:
+            return 0
+        course_name = pending[0].course_name
+        number_placed = 0
+        while pending:
+            busy_masks = np.array([student_lookup.get_schedule_mask(request.student_name) |
+                                   schedule_data.prerequisites.get_blocked_mask(request.request_id, requests)
+                                   for request in pending], dtype=course_data.mask_dtype)
+            semester_loads = np.array([student_lookup.get_course_load_by_semester(request.student_name)
+                                       for request in pending], dtype=np.int64)
+            semesters, periods = course_data.choose_slots(course_name, busy_masks, semester_loads)
+            retry = []
+            students_placed = set()
+            for request, semester, period in zip(pending, semesters.tolist(), periods.tolist()):
+                if semester < 0:
+                    self.schedule_conflict.append(request)
+                    continue
+                course_offering = course_data.lookupByPeriod[semester][period][course_name]
+                if course_data.get_seats_left(course_offering) <= 0 or request.student_name in students_placed:
+                    retry.append(request)
+                    continue
+                schedule_data.assign_student_to_course(request, course_offering)
+                students_placed.add(request.student_name)
+                number_placed += 1
+            pending = retry
+
+        # keep the seat term of any of the course's queued requests current
+        if course_name in self.course_seats_available:
+            self.course_seats_available[course_name] -= number_placed
+            self.rescore_course(course_name)
+        return number_placed
+
+    def measure_load_imbalance(self):
+        """Sum over students of the busiest minus the lightest semester load in periods"""
+        student_lookup = self.schedule_data.student_lookup
+        imbalance = 0
+        for student_name in self.schedule_data.course_requests.by_student:
+            course_load_by_semester = student_lookup.get_course_load_by_semester(student_name)
+            imbalance += max(course_load_by_semester) - min(course_load_by_semester)
+        return imbalance
+
+
+class ScheduleRepair:
+    """
+    Time-budgeted local search over the requests left in schedule_conflict
+    A conflicted request tries each offering of its course. Requests of the
+    same student that overlap the offering are moved to another open
+    offering of their course (an ejection chain) and a full offering makes
+    room by moving one of its most flexible students to another offering of
+    the same course. Every move is checked against the period masks and seat
+    counts and is undone if the chain fails
+    """
+    def __init__(self, schedule_data: SchedulingData, time_budget=10.0, max_depth=2, bump_candidates=20,
+                 verbose=True):
+        """
+        time_budget: seconds allowed for the repair phase
+        max_depth: longest chain of displaced requests for one repair
+        bump_candidates: enrolled students tried when making room in a full offering
+        """
+        self.schedule_data = schedule_data
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.bump_candidates = bump_candidates
+        self.verbose = verbose
+        self.moves = [] # (request, offering before the move) for undo
+        self.reserved = {} # student_name -> periods held for a pending move
+        self.moves_evaluated = 0
+        self.deadline = None
+
+    def repair_conflicts(self, schedule_conflict):
+        """
+        Attempts to place each conflicted request until no pass makes progress
+        or the time budget is spent
+        :param schedule_conflict: [StudentCourseRequest] left by a scheduler
+        :return: [StudentCourseRequest] still unresolved
+        """
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+        remaining = list(schedule_conflict)
+        number_conflicts = len(remaining)
+        depth = 1
+        while remaining and time.perf_counter() < self.deadline:
+            unresolved = []
+            for request in remaining:
+                self.moves = []
+                if request.assigned_course is None and not self.place_request(request, depth, frozenset()):
+                    unresolved.append(request)
+            if len(unresolved) == len(remaining):
+                # no progress at this depth, allow longer chains
+                if depth == self.max_depth:
+                    break
+                depth += 1
+            remaining = unresolved
+        self.moves = []
+
+        if self.verbose:
+            print("Repair completed.  {} of {} conflicts resolved in {:.1f}s ({} moves evaluated)".format(
+                number_conflicts - len(remaining), number_conflicts, time.perf_counter() - start,
+                self.moves_evaluated))
+        return remaining
+
+    def place_request(self, request: StudentCourseRequest, depth, locked, excluded=None):
+        """
+        Assigns an unassigned request, displacing other requests up to depth
+        moves deep; on failure every move is undone
+        locked: request ids already moved in this chain that may not move again
+        excluded: offering the request may not be placed in
+        """
+        offerings = [offering for offering in
+                     self.schedule_data.course_data.get_course_capacity(request.course_name).offerings
+                     if offering is not excluded]
+        schedule_mask = self.get_request_busy_mask(request)
+        for offering in offerings:
+            self.moves_evaluated += 1
+            if not offering.period_mask & schedule_mask and offering.number_seats_available() > 0:
+                self.assign(request, offering)
+                return True
+        if depth == 0:
+            return False
+
+        locked = locked | {request.request_id}
+        for offering in offerings:
+            if time.perf_counter() > self.deadline:
+                return False
+            mark = len(self.moves)
+            if self.make_room(request, offering, depth, locked) and \
+                    not offering.period_mask & self.get_request_busy_mask(request) and \
+                    offering.number_seats_available() > 0:
+                self.assign(request, offering)
+                return True
+            self.undo(mark)
+        return False
+
+    def make_room(self, request: StudentCourseRequest, offering: CourseOffering, depth, locked):
+        """Moves the student's overlapping requests and, if full, one enrolled student out of offering"""
+        self.moves_evaluated += 1
+        student_lookup = self.schedule_data.student_lookup
+        blockers = [blocker for blocker in self.schedule_data.course_requests.get_student_requests(request.student_name)
+                    if blocker.assigned_course is not None and
+                    blocker.assigned_course.period_mask & offering.period_mask]
+        for blocker in blockers:
+            if blocker.request_id in locked:
+                return False
+        if blockers:
+            for blocker in blockers:
+                self.unassign(blocker)
+            # reserve the target periods so the blockers are moved elsewhere
+            previous_reserved = self.reserved.get(request.student_name, 0)
+            self.reserved[request.student_name] = previous_reserved | offering.period_mask
+            placed = True
+            for blocker in blockers:
+                if not self.place_request(blocker, depth - 1, locked):
+                    placed = False
+                    break
+            self.reserved[request.student_name] = previous_reserved
+            if not placed:
+                return False
+            locked = locked | {blocker.request_id for blocker in blockers}
+
+        if offering.number_seats_available() > 0:
+            return True
+        if depth == 0:
+            return False
+        # bump the most flexible enrolled students first
+        requests = self.schedule_data.course_requests.requests
+        candidates = [requests[request_id] for request_id in offering.students_enrolled
+                      if request_id not in locked]
+        candidates.sort(key=lambda enrolled: student_lookup.get_schedule_mask(enrolled.student_name).bit_count())
+        for enrolled in candidates[:self.bump_candidates]:
+            mark = len(self.moves)
+            self.unassign(enrolled)
+            if self.place_request(enrolled, depth - 1, locked | {enrolled.request_id}, excluded=offering):
+                return True
+            self.undo(mark)
+        return False
+
+    def get_busy_mask(self, student_name):
+        """Periods the student is scheduled in or that are held for a pending move"""
+        return self.schedule_data.student_lookup.get_schedule_mask(student_name) | \
+            self.reserved.get(student_name, 0)
+
+    def get_request_busy_mask(self, request: StudentCourseRequest):
+        """The student's busy periods plus the semesters the request's prerequisites rule out"""
+        return self.get_busy_mask(request.student_name) | \
+            self.schedule_data.prerequisites.get_blocked_mask(request.request_id,
+                                                              self.schedule_data.course_requests.requests)
+
+    def assign(self, request: StudentCourseRequest, offering: CourseOffering):
+        self.moves.append((request, request.assigned_course))
+        self.schedule_data.assign_student_to_course(request, offering)
+
+    def unassign(self, request: StudentCourseRequest):
+        self.moves.append((request, request.assigned_course))
+        self.schedule_data.unassign_student_from_course(request)
+
+    def undo(self, mark):
+        """Reverts the moves made after position mark of the move log"""
+        while len(self.moves) > mark:
+            request, offering = self.moves.pop()
+            if request.assigned_course is not None:
+                self.schedule_data.unassign_student_from_course(request)
+            if offering is not None:
+                self.schedule_data.assign_student_to_course(request, offering)
+
+
+# SchedulingData loaded once per multi-start worker process, with the
+# assignments every run starts from
+_worker_schedule_data = None
+_worker_initial_assignments = None
+
+
+def _init_multi_start_worker(schedule_data):
+    global _worker_schedule_data, _worker_initial_assignments
+    _worker_schedule_data = schedule_data
+    _worker_initial_assignments = schedule_data.get_assignment_array()
+
+
+def _run_seeded_greedy(seed, deadline):
+    """Runs one seeded greedy schedule in a worker; skipped once the deadline passes"""
+    if deadline is not None and time.time() > deadline:
+        return seed, None, None
+    _worker_schedule_data.clear_assignments()
+    _worker_schedule_data.apply_assignment_array(_worker_initial_assignments)
+    scheduler = ScheduleCourses(_worker_schedule_data, seed=seed, verbose=False)
+    scheduler.match_courses_greedy_algorithm()
+    return seed, len(scheduler.schedule_conflict), _worker_schedule_data.get_assignment_array()
+
+
+class MultiStartScheduler:
+    """
+    Runs seeded greedy schedules across a process pool and keeps the one
+    with the fewest conflicts. The SchedulingData is handed to each worker
+    once and runs only send back compact assignment arrays
+    """
+    def __init__(self, schedule_data: SchedulingData, number_runs, time_budget=None, processes=None, first_seed=0,
+                 checkpoint=None):
+        """
+        number_runs: number of seeds to try (first_seed, first_seed + 1, ...)
+        time_budget: seconds after which no new runs start and unfinished runs are dropped
+        processes: worker processes, defaults to the number of CPUs
+        checkpoint: ScheduleCheckpoint with get_checkpoint_fields that records
+        every finished run; runs it already holds are not repeated
+        """
+        self.schedule_data = schedule_data
+        self.number_runs = number_runs
+        self.time_budget = time_budget
+        self.processes = processes
+        self.first_seed = first_seed
+        self.checkpoint = checkpoint
+        self.schedule_conflict = []
+        self.best_seed = None
+        self.run_conflicts = {} # seed -> number of conflicts
+
+    @staticmethod
+    def get_checkpoint_fields(schedule_data: SchedulingData, number_runs):
+        """Layout of a multi-start checkpoint, see ScheduleCheckpoint"""
+        return {
+            'run_conflicts': (np.int64, number_runs), # by seed - first_seed, -1 until the run finishes
+            'best_seed': (np.int64, 1),
+            'best_assignments': (np.int16, len(schedule_data.course_requests)),
+        }
+
+    def match_courses_multi_start(self):
+        deadline = None if self.time_budget is None else time.time() + self.time_budget
+        run_conflicts = np.full(self.number_runs, -1, dtype=np.int64)
+        best = None # (conflicts, seed, assignments)
+        state = None if self.checkpoint is None else self.checkpoint.load()
+        if state is not None and len(state['best_seed']) > 0:
+            run_conflicts = state['run_conflicts']
+            best_seed = int(state['best_seed'][0])
+            best = (int(run_conflicts[best_seed - self.first_seed]), best_seed, state['best_assignments'])
+            for index in np.flatnonzero(run_conflicts >= 0).tolist():
+                self.run_conflicts[self.first_seed + index] = int(run_conflicts[index])
+            print("Resumed {} finished multi-start runs from the checkpoint".format(len(self.run_conflicts)))
+        seeds = [self.first_seed + index for index in np.flatnonzero(run_conflicts < 0).tolist()]
+        with multiprocessing.Pool(self.processes, initializer=_init_multi_start_worker,
+                                  initargs=(self.schedule_data,)) as pool:
+            results = pool.imap_unordered(partial(_run_seeded_greedy, deadline=deadline), seeds)
+            while True:
+                try:
+                    timeout = None if deadline is None else max(deadline - time.time(), 0)
+                    seed, conflicts, assignments = results.next(timeout)
+                except (StopIteration, multiprocessing.TimeoutError):
+                    break
+                if conflicts is None:
+                    continue
+                self.run_conflicts[seed] = conflicts
+                # ties go to the lowest seed so the choice is deterministic
+                if best is None or (conflicts, seed) < best[:2]:
+                    best = (conflicts, seed, assignments)
+                if self.checkpoint is not None:
+                    run_conflicts[seed - self.first_seed] = conflicts
+                    self.checkpoint.save({'run_conflicts': run_conflicts, 'best_seed': [best[1]],
+                                          'best_assignments': best[2]})
+
+        if best is None:
+            raise RuntimeError("No multi-start run finished within the time budget")
+        self.best_seed = best[1]
+        self.schedule_data.clear_assignments()
+        self.schedule_data.apply_assignment_array(best[2])
+        self.schedule_conflict = list(self.schedule_data.unscheduled_course_requests)
+        print("Multi-start completed.  {} of {} runs finished, best seed {} with {} conflicts".format(
+            len(self.run_conflicts), self.number_runs, self.best_seed, len(self.schedule_conflict)))
+
+
+# SchedulingData, seat quotas and starting assignments of a partition worker
+_partition_worker_state = None
+
+
+def _init_partition_worker(schedule_data, request_partition, offering_quota):
+    global _partition_worker_state
+    _partition_worker_state = (schedule_data, request_partition, offering_quota,
+                               schedule_data.get_assignment_array())
+
+
+def _run_partition(partition, seed):
+    """
+    Schedules the unscheduled requests of one partition in a worker, with
+    each offering limited to the seats reserved for the partition
+    :return: (partition, request ids, assignment of each request id)
+    """
+    schedule_data, request_partition, offering_quota, initial_assignments = _partition_worker_state
+    # a worker may run several partitions, so start from the parent's state each time
+    schedule_data.clear_assignments()
+    schedule_data.apply_assignment_array(initial_assignments)
+    for offering in schedule_data.course_data.offerings:
+        quota = offering_quota[partition, offering.offering_id]
+        if quota >= 0:
+            offering.number_seats_total = len(offering.students_enrolled) + int(quota)
+    # the course index totals and the seat matrix are rebuilt from the quotas
+    schedule_data.course_data.course_index = None
+    schedule_data.course_data.refresh_seats()
+
+    request_ids = [request_id for request_id in schedule_data.course_requests.unscheduled
+                   if request_partition[request_id] == partition]
+    scheduler = ScheduleCourses(schedule_data, seed=seed, verbose=False, seat_share=1 / len(offering_quota))
+    if request_ids:
+        scheduler.create_unscheduled_priority_queue(request_ids)
+        scheduler.match_courses_greedy_algorithm()
+    request_ids = np.array(request_ids, dtype=np.int64)
+    return partition, request_ids, schedule_data.get_assignment_array()[request_ids]
+
+
+class PartitionedScheduler:
+    """
+    Schedules groups of students concurrently in a process pool and merges
+    the results. Students are split into partitions that share as few
+    contended courses as possible, and every offering's open seats are
+    reserved to the partitions in proportion to their requests for the
+    course, so the merged partitions never overfill an offering. Requests a
+    partition could not place are then scheduled sequentially against the
+    seats the other partitions left unused
+    """
+    def __init__(self, schedule_data: SchedulingData, number_partitions=None, processes=None, seed=None,
+                 contention=0.9, verbose=True, metrics=None):
+        """
+        number_partitions: student partitions, defaults to the number of worker processes
+        processes: worker processes, defaults to the number of CPUs
+        seed: partition p runs greedy with seed + p, and the final pass with seed
+        contention: a course couples its students when its requests exceed this fraction of its seats
+        metrics: ScheduleMetrics to time the stages in, or None
+        """
+        self.schedule_data = schedule_data
+        self.processes = processes
+        self.number_partitions = number_partitions or processes or multiprocessing.cpu_count()
+        self.seed = seed
+        self.contention = contention
+        self.verbose = verbose
+        self.metrics = metrics
+        self.schedule_conflict = []
+        self.request_partition = None # partition of each request
+        self.boundary_courses = [] # contended courses requested in more than one partition
+
+    def find_partitions(self):
+        """
+        Orders the students by a breadth-first walk of the student-course
+        graph, following only contended courses, so each connected cluster of
+        students is contiguous and the students of a course sit together.
+        The order is cut into partitions with equal numbers of requests,
+        which splits at most number_partitions - 1 clusters
+        :return: numpy array of the partition of each request
+        """
+        course_requests = self.schedule_data.course_requests
+        request_student = np.frombuffer(course_requests.request_student, dtype=np.int32)
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+        number_students = len(course_requests.student_names)
+        seats = self.schedule_data.course_data.get_supply_matrix(course_requests.course_names).sum(axis=1)
+        demand = np.bincount(request_course, minlength=len(course_requests.course_names))
+        contended = (seats > 0) & (demand > self.contention * seats)
+
+        student_courses = [[] for _ in range(number_students)]
+        course_students = [[] for _ in range(len(course_requests.course_names))]
+        coupled = contended[request_course]
+        for student, course in zip(request_student[coupled].tolist(), request_course[coupled].tolist()):
+            student_courses[student].append(course)
+            course_students[course].append(student)
+
+        order = []
+        visited_student = np.zeros(number_students, dtype=bool)
+        visited_course = np.zeros(len(course_students), dtype=bool)
+        for start in range(number_students):
+            if visited_student[start]:
+                continue
+            visited_student[start] = True
+            frontier = deque([start])
+            while frontier:
+                student = frontier.popleft()
+                order.append(student)
+                for course in student_courses[student]:
+                    if visited_course[course]:
+                        continue
+                    visited_course[course] = True
+                    for neighbour in course_students[course]:
+                        if not visited_student[neighbour]:
+                            visited_student[neighbour] = True
+                            frontier.append(neighbour)
+
+        order = np.array(order, dtype=np.int64)
+        weight = np.bincount(request_student, minlength=number_students)[order]
+        # the partition of a student is where its first request falls in the cumulative request count
+        start = np.cumsum(weight) - weight
+        student_partition = np.empty(number_students, dtype=np.int64)
+        student_partition[order] = np.minimum(start * self.number_partitions // max(len(request_student), 1),
+                                              self.number_partitions - 1)
+        self.request_partition = student_partition[request_student]
+
+        partition_demand = np.zeros((self.number_partitions, len(course_students)), dtype=np.int64)
+        np.add.at(partition_demand, (self.request_partition, request_course), 1)
+        shared = contended & ((partition_demand > 0).sum(axis=0) > 1)
+        self.boundary_courses = [course_requests.course_names[course_id] for course_id in np.flatnonzero(shared)]
+        return self.request_partition
+
+    def reserve_seats(self):
+        """
+        Splits the open seats of every offering among the partitions in
+        proportion to each partition's unscheduled requests for the course,
+        handing the seats left by rounding down to the largest remainders
+        :return: numpy array [partition][offering_id] of seats, -1 for
+        offerings of courses nobody requests
+        """
+        course_requests = self.schedule_data.course_requests
+        course_data = self.schedule_data.course_data
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+        unscheduled = np.fromiter(course_requests.unscheduled.keys(), dtype=np.int64)
+        partition_demand = np.zeros((self.number_partitions, len(course_requests.course_names)), dtype=np.int64)
+        np.add.at(partition_demand, (self.request_partition[unscheduled], request_course[unscheduled]), 1)
+
+        offering_ids, offering_course, offering_seats = [], [], []
+        for course_id, course_name in enumerate(course_requests.course_names):
+            for offering in course_data.get_course_capacity(course_name).offerings:
+                offering_ids.append(offering.offering_id)
+                offering_course.append(course_id)
+                offering_seats.append(max(offering.number_seats_available(), 0))
+        offering_ids = np.array(offering_ids, dtype=np.int64)
+        offering_seats = np.array(offering_seats, dtype=np.int64)
+
+        share = partition_demand[:, np.array(offering_course, dtype=np.int64)].astype(np.float64)
+        total = share.sum(axis=0)
+        exact = share * (offering_seats / np.maximum(total, 1))
+        quota = np.floor(exact).astype(np.int64)
+        # rank partitions by remainder within each offering, lowest partition first on ties
+        leftover = np.where(total > 0, offering_seats - quota.sum(axis=0), 0)
+        rank = np.argsort(np.argsort(-(exact - quota), axis=0, kind='stable'), axis=0, kind='stable')
+        quota += rank < leftover
+
+        offering_quota = np.full((self.number_partitions, len(course_data.offerings)), -1, dtype=np.int64)
+        offering_quota[:, offering_ids] = quota
+        return offering_quota
+
+    def match_courses_partitioned(self):
+        with phase_timer(self.metrics, "find_partitions"):
+            self.find_partitions()
+            offering_quota = self.reserve_seats()
+
+        partitions = range(self.number_partitions)
+        seeds = [None if self.seed is None else self.seed + partition for partition in partitions]
+        merged = np.full(len(self.schedule_data.course_requests), -1, dtype=np.int16)
+        with phase_timer(self.metrics, "schedule_partitions"):
+            with multiprocessing.Pool(min(self.processes or multiprocessing.cpu_count(), self.number_partitions),
+                                      initializer=_init_partition_worker,
+                                      initargs=(self.schedule_data, self.request_partition, offering_quota)) as pool:
+                for partition, request_ids, assignments in pool.starmap(_run_partition, zip(partitions, seeds)):
+                    merged[request_ids] = assignments
 
+        with phase_timer(self.metrics, "merge_partitions"):
+            # the quotas never add up to more than an offering's open seats
+            self.schedule_data.apply_assignment_array(merged)
+        number_retried = len(self.schedule_data.unscheduled_course_requests)
+        scheduler = ScheduleCourses(self.schedule_data, seed=self.seed, verbose=False, metrics=self.metrics)
+        scheduler.match_courses_greedy_algorithm()
+        self.schedule_conflict = scheduler.schedule_conflict
+        if self.metrics is not None:
+            self.metrics.count("boundary courses", len(self.boundary_courses))
+            self.metrics.count("requests retried after merge", number_retried)
+        if self.verbose:
+            print("Partitioned scheduler completed.  {} partitions sharing {} contended courses, "
+                  "{} requests retried after the merge, {} conflicts were unresolved".format(
+                      self.number_partitions, len(self.boundary_courses), number_retried,
+                      len(self.schedule_conflict)))
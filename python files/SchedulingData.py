@@ -1,7 +1,98 @@
 import csv
+import sys
+from array import array
+import numpy as np
+
+# The data classes use __slots__ and integer ids to keep several academic
+# years of students in memory; names read from the CSVs are interned so each
+# student and course name is stored once
+
+class PeriodGrid:
+    """
+    The semesters and periods being scheduled and the period masks they imply
+    A slot is semester*number_periods + period, the bit it uses in schedule masks
+    semester_names[semester] <- name used by the PCO and output files
+    period_labels[period] <- label such as 'M1'; the letters name the day of the block cycle
+    span_masks[contact][period] <- bits within a semester of an offering that starts at period
+    year_semester_names <- every semester of the academic year, a superset of semester_names
+    """
+    def __init__(self, semester_names=("Fall", "Winter", "Spring"),
+                 period_labels=("M1", "M2", "M3", "M4", "T1", "T2", "T3", "T4"), year_semester_names=None):
+        self.semester_names = tuple(semester_names)
+        self.period_labels = tuple(period_labels)
+        self.year_semester_names = tuple(year_semester_names or semester_names)
+        self.number_semesters = len(self.semester_names)
+        self.number_periods = len(self.period_labels)
+        self.number_slots = self.number_semesters * self.number_periods
+        self.semester_mask = (1 << self.number_periods) - 1
+        self.semester_index = {name: index for index, name in enumerate(self.semester_names)}
+        self.period_index = {label: index for index, label in enumerate(self.period_labels)}
+
+        # an offering meets contact consecutive periods (at least one) without
+        # running past the last period of its day
+        days = [label.rstrip("0123456789") for label in self.period_labels]
+        self.span_masks = []
+        for contact in range(self.number_periods + 1):
+            masks = []
+            for period in range(self.number_periods):
+                mask = 0
+                for offset in range(max(contact, 1)):
+                    if period + offset < self.number_periods and days[period + offset] == days[period]:
+                        mask |= 1 << (period + offset)
+                masks.append(mask)
+            self.span_masks.append(masks)
+
+    @classmethod
+    def from_sizes(cls, number_semesters=3, number_periods=8):
+        """Grid with the usual semester names and periods split over an M and a T day"""
+        year_semester_names = ("Fall", "Winter", "Spring")
+        if number_semesters <= len(year_semester_names):
+            semester_names = year_semester_names[:number_semesters]
+        else:
+            semester_names = tuple("Semester {}".format(index + 1) for index in range(number_semesters))
+        m_periods = (number_periods + 1) // 2
+        period_labels = ["M{}".format(index + 1) for index in range(m_periods)] + \
+                        ["T{}".format(index + 1) for index in range(number_periods - m_periods)]
+        return cls(semester_names, period_labels)
+
+    def single_semester(self, semester_name):
+        """Grid with only one of this grid's semesters, for rescheduling a single term"""
+        if semester_name not in self.semester_index:
+            raise ValueError("Unknown semester {}, expected one of {}".format(semester_name, self.semester_names))
+        return PeriodGrid((semester_name,), self.period_labels, self.year_semester_names)
+
+    def describe(self):
+        """Text that identifies the grid, e.g. as part of a cache key"""
+        return "{};{};{}".format("|".join(self.semester_names), "|".join(self.period_labels),
+                                 "|".join(self.year_semester_names))
+
+    def get_semester(self, semester_name):
+        """Index of a semester of the grid, or None when the grid leaves it out"""
+        return self.semester_index.get(semester_name)
+
+    def get_period(self, period_label):
+        if period_label not in self.period_index:
+            raise ValueError("Unknown period {}, expected one of {}".format(period_label, self.period_labels))
+        return self.period_index[period_label]
+
+    def get_year_semester(self, semester_name):
+        """Index of a semester in the academic year, later names count as the last semester"""
+        if semester_name in self.year_semester_names:
+            return self.year_semester_names.index(semester_name)
+        return len(self.year_semester_names) - 1
+
+    def is_full_year(self):
+        """Whether the grid schedules every semester of the academic year"""
+        return self.semester_names == self.year_semester_names
+
+    def get_period_mask(self, semester, period, contact):
+        return self.span_masks[min(contact, self.number_periods)][period] << (semester * self.number_periods)
+
 
 class Course:
     """Stores information about a single course"""
+    __slots__ = ('course_name', 'dept', 'credits', 'contact', 'min_seats', 'max_seats', 'course_id')
+
     def __init__(self, course_name, dept, credits, contact, min_seats, max_seats):
         self.course_name = course_name
         self.dept = dept
@@ -9,25 +100,13 @@ class Course:
         self.contact = contact
         self.min_seats = min_seats
         self.max_seats = max_seats
+        self.course_id = None # set by CourseLookupData
 
 class CourseOffering:
     """Stores information for a single course"""
-    period_lookup = {
-    0: 'M1',
-    1: 'M2',
-    2: 'M3',
-    3: 'M4',
-    4: 'T1',
-    5: 'T2',
-    6: 'T3',
-    7: 'T4'
-    }
-
-    semester_lookup = {
-    0: 'Fall',
-    1: 'Winter',
-    2: 'Spring'
-    }
+    __slots__ = ('course_name', 'period', 'semester', 'number_seats_total', 'course_info',
+                 'students_enrolled', 'period_mask', 'offering_id')
+
     def __init__(self, course_name, semester, period, number_seats, course_info):
         """initializes a new instance of the object
         course_name: eg CompSci 110 or CompSci 110S
@@ -40,13 +119,17 @@ class CourseOffering:
         self.semester = semester
         self.number_seats_total = number_seats
         self.course_info = course_info # Course object
-        self.students_enrolled = []
+        self.students_enrolled = set() # request_id of each enrolled StudentCourseRequest
+        self.period_mask = 0 # semester/period bits occupied, set by CourseLookupData
+        self.offering_id = None # set by CourseLookupData
 
     def number_seats_available(self):
         return self.number_seats_total - len(self.students_enrolled)
 
 class Student:
     """Stores info about a student"""
+    __slots__ = ('student_name', 'year', 'sport', 'gender')
+
     def __init__(self, student_name, year, sport=None, gender=None):
         self.student_name = student_name
         self.year = year
@@ -61,6 +144,8 @@ class Student:
         
 class SportInfo:
     """Stores info about each team like when they practice and their offseason"""
+    __slots__ = ('sport', 'gender', 'practice_m', 'practice_t', 'offseason')
+
     def __init__(self, sport, gender, practice_m, practice_t, offseason):
         self.sport = sport
         self.gender = gender
@@ -70,35 +155,538 @@ class SportInfo:
 
 class StudentCourseRequest:
     """Stores a student-course request and assignment (when made) pairing"""
+    __slots__ = ('student_name', 'course_name', 'request_id', 'assigned_course')
 
     def __init__(self, student_name, course_name):
         self.student_name = student_name
         self.course_name = course_name
+        self.request_id = None # set by CourseRequestStore
 
         self.assigned_course: CourseOffering = None
 
     def summary_request(self):
         return "{},{}".format(self.student_name,self.course_name)
-        
+
+
+class CourseRequestStore:
+    """
+    Indexed storage for every StudentCourseRequest
+    self.requests[request_id] <- StudentCourseRequest
+    self.unscheduled{request_id} <- StudentCourseRequest (insertion ordered)
+    self.by_student{student_name} <- [request_id]
+    self.by_course{course_name} <- [request_id]
+    self.student_ids{student_name} / self.course_ids{course_name} <- interned integer id
+    self.request_student[request_id] / self.request_course[request_id] <- interned id
+    Request ids are stable list positions so removing and re-inserting a
+    request in the unscheduled set is O(1)
+    """
+    def __init__(self):
+        self.requests = []
+        self.unscheduled = {}
+        self.by_student = {}
+        self.by_course = {}
+        self.student_ids = {}
+        self.course_ids = {}
+        self.student_names = []
+        self.course_names = []
+        self.request_student = array('i')
+        self.request_course = array('i')
+
+    def __len__(self):
+        return len(self.requests)
+
+    def add_request(self, student_course_request: StudentCourseRequest):
+        request_id = len(self.requests)
+        student_course_request.request_id = request_id
+        self.requests.append(student_course_request)
+        self.unscheduled[request_id] = student_course_request
+        if student_course_request.student_name not in self.by_student:
+            self.by_student[student_course_request.student_name] = []
+            self.student_ids[student_course_request.student_name] = len(self.student_names)
+            self.student_names.append(student_course_request.student_name)
+        self.by_student[student_course_request.student_name].append(request_id)
+        if student_course_request.course_name not in self.by_course:
+            self.by_course[student_course_request.course_name] = []
+            self.course_ids[student_course_request.course_name] = len(self.course_names)
+            self.course_names.append(student_course_request.course_name)
+        self.by_course[student_course_request.course_name].append(request_id)
+        self.request_student.append(self.student_ids[student_course_request.student_name])
+        self.request_course.append(self.course_ids[student_course_request.course_name])
+        return request_id
+
+    def add_requests(self, student_names, course_names, request_student, request_course):
+        """
+        Bulk version of add_request that fills an empty store from interned columns
+        student_names, course_names: name tables
+        request_student, request_course: numpy arrays of indexes into the name tables
+        :return: [StudentCourseRequest] created, in request_id order
+        """
+        if self.requests:
+            raise ValueError("add_requests needs an empty CourseRequestStore")
+        self.student_names, store_student = self.intern_first_appearance(student_names, request_student)
+        self.course_names, store_course = self.intern_first_appearance(course_names, request_course)
+        self.student_ids = {student_name: index for index, student_name in enumerate(self.student_names)}
+        self.course_ids = {course_name: index for index, course_name in enumerate(self.course_names)}
+        self.request_student = array('i', store_student.astype(np.int32).tobytes())
+        self.request_course = array('i', store_course.astype(np.int32).tobytes())
+
+        request_student_names = np.array(self.student_names, dtype=object)[store_student].tolist()
+        request_course_names = np.array(self.course_names, dtype=object)[store_course].tolist()
+        self.requests = [StudentCourseRequest(student_name, course_name)
+                         for student_name, course_name in zip(request_student_names, request_course_names)]
+        for request_id, student_course_request in enumerate(self.requests):
+            student_course_request.request_id = request_id
+        self.unscheduled = dict(enumerate(self.requests))
+        self.by_student = dict(zip(self.student_names, self.group_request_ids(store_student, len(self.student_names))))
+        self.by_course = dict(zip(self.course_names, self.group_request_ids(store_course, len(self.course_names))))
+        return self.requests
+
+    @staticmethod
+    def intern_first_appearance(names, codes):
+        """Renumbers codes by first appearance, the order add_request assigns ids in"""
+        unique_codes, first_index, inverse = np.unique(codes, return_index=True, return_inverse=True)
+        appearance_order = np.argsort(first_index)
+        new_codes = np.empty(len(unique_codes), dtype=np.int64)
+        new_codes[appearance_order] = np.arange(len(unique_codes))
+        return [names[code] for code in unique_codes[appearance_order].tolist()], new_codes[inverse.ravel()]
+
+    @staticmethod
+    def group_request_ids(codes, number_codes):
+        """[[request_id]] for each code, request ids ascending"""
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes, minlength=number_codes))[:-1]
+        return [group.tolist() for group in np.split(order, bounds)]
+
+    def get_request(self, request_id):
+        return self.requests[request_id]
+
+    def mark_scheduled(self, student_course_request: StudentCourseRequest):
+        self.unscheduled.pop(student_course_request.request_id, None)
+
+    def mark_unscheduled(self, student_course_request: StudentCourseRequest):
+        self.unscheduled[student_course_request.request_id] = student_course_request
+
+    def get_student_requests(self, student_name):
+        return [self.requests[i] for i in self.by_student.get(student_name, [])]
+
+    def get_course_requests(self, course_name):
+        return [self.requests[i] for i in self.by_course.get(course_name, [])]
+
+
+class PrerequisiteIndex:
+    """
+    Prerequisite DAG of courses, its transitive closure and the requests of
+    each student that it orders; a prerequisite must be in an earlier semester
+    prerequisites{course_name} <- {course_name} direct prerequisites
+    closure{course_name} <- frozenset of every course required before it
+    earlier{request_id} <- [request_id] same student's requests for a course required before it
+    later{request_id} <- [request_id] same student's requests for a course that requires it
+    fixed_mask{request_id} <- slots ruled out because the rest of its chain needs semesters before or after it;
+        every ordered request has an entry, so membership is the check for whether a request is ordered
+    """
+    def __init__(self, period_grid: PeriodGrid):
+        self.period_grid = period_grid
+        self.prerequisites = {}
+        self.closure = {}
+        self.earlier = {}
+        self.later = {}
+        self.fixed_mask = {}
+        # slots of the semesters up to and including, and starting from, each semester
+        all_slots = (1 << period_grid.number_slots) - 1
+        self.through_semester = [(1 << (semester + 1) * period_grid.number_periods) - 1
+                                 for semester in range(period_grid.number_semesters)]
+        self.from_semester = [all_slots & ~((1 << semester * period_grid.number_periods) - 1)
+                              for semester in range(period_grid.number_semesters)]
+
+    def add_prerequisite(self, course_name, prerequisite):
+        self.prerequisites.setdefault(course_name, set()).add(prerequisite)
+
+    def build_closure(self):
+        """Computes every course's transitive prerequisites; raises ValueError on a cycle"""
+        self.closure = {}
+        visiting = set()
+
+        def visit(course_name):
+            if course_name in self.closure:
+                return self.closure[course_name]
+            if course_name in visiting:
+                raise ValueError("Prerequisite cycle through {}".format(course_name))
+            visiting.add(course_name)
+            required = set()
+            for prerequisite in self.prerequisites.get(course_name, ()):
+                required.add(prerequisite)
+                required |= visit(prerequisite)
+            visiting.discard(course_name)
+            self.closure[course_name] = frozenset(required)
+            return self.closure[course_name]
+
+        for course_name in list(self.prerequisites):
+            visit(course_name)
+
+    def requires(self, course_name, prerequisite):
+        """Whether prerequisite must be taken before course_name, directly or through a chain"""
+        return prerequisite in self.closure.get(course_name, ())
+
+    def index_requests(self, course_requests):
+        """Pairs up each student's requests that the closure orders; call again after requests are added"""
+        self.earlier, self.later, self.fixed_mask = {}, {}, {}
+        ordered_courses = set(self.closure)
+        for required in self.closure.values():
+            ordered_courses |= required
+        requests = course_requests.requests
+        for request_ids in course_requests.by_student.values():
+            chained = [request_id for request_id in request_ids if requests[request_id].course_name in ordered_courses]
+            if len(chained) < 2:
+                continue
+            for request_id in chained:
+                for other in chained:
+                    if self.requires(requests[request_id].course_name, requests[other].course_name):
+                        self.earlier.setdefault(request_id, []).append(other)
+                        self.later.setdefault(other, []).append(request_id)
+            self.index_chain_lengths(chained)
+
+    def index_chain_lengths(self, chained):
+        """Rules out the semesters a request cannot use given how many requests must come before and after it"""
+        before, after = {}, {}
+
+        def chain_length(request_id, partners, lengths):
+            if request_id not in lengths:
+                lengths[request_id] = max((1 + chain_length(other, partners, lengths)
+                                           for other in partners.get(request_id, ())), default=0)
+            return lengths[request_id]
+
+        last_semester = self.period_grid.number_semesters - 1
+        for request_id in chained:
+            first = chain_length(request_id, self.earlier, before)
+            last = last_semester - chain_length(request_id, self.later, after)
+            mask = 0
+            for semester in range(self.period_grid.number_semesters):
+                if semester < first or semester > last:
+                    mask |= self.period_grid.semester_mask << (semester * self.period_grid.number_periods)
+            if mask:
+                self.fixed_mask[request_id] = mask
+
+    def get_blocked_mask(self, request_id, requests):
+        """
+        Slots a request may not use: its fixed mask plus every semester not
+        after its assigned prerequisites and not before its assigned dependents
+        """
+        mask = self.fixed_mask.get(request_id, 0)
+        for other in self.earlier.get(request_id, ()):
+            offering = requests[other].assigned_course
+            if offering is not None:
+                mask |= self.through_semester[offering.semester]
+        for other in self.later.get(request_id, ()):
+            offering = requests[other].assigned_course
+            if offering is not None:
+                mask |= self.from_semester[offering.semester]
+        return mask
+
+    def get_allowed_fraction(self, number_requests):
+        """numpy array [request_id] of the share of semesters each request may use"""
+        allowed = np.ones(number_requests)
+        slots = self.period_grid.number_slots
+        for request_id, mask in self.fixed_mask.items():
+            allowed[request_id] = (slots - mask.bit_count()) / slots
+        return allowed
+
+
+class ExpansionRule:
+    """One expansion rule: the trigger that fires it and the courses it requests"""
+    __slots__ = ('rule_id', 'trigger', 'value', 'course_names', 'take')
+
+    def __init__(self, rule_id, trigger, value, course_names, take):
+        self.rule_id = rule_id
+        self.trigger = trigger # 'course' or a student or sport attribute
+        self.value = value # course name or attribute value
+        self.course_names = course_names # [course_name]
+        self.take = take # courses requested per student, all of them when equal to len(course_names)
+
+
+class RequestExpansionRules:
+    """
+    Rules that generate requests for the students they match, compiled into
+    indexes so every student is expanded in one pass
+    A rule fires on a requested course (trigger 'course') or on an attribute of
+    the student or of the student's sport; an empty value matches an empty
+    attribute, so sport with no value matches students without a sport
+    by_course{course_name} <- [ExpansionRule] fired by a request for the course
+    by_attribute{(attribute, value)} <- [ExpansionRule] fired by the attribute value
+    trigger_courses <- set of course names that fire a rule
+    """
+    STUDENT_ATTRIBUTES = ('year', 'sport', 'gender')
+    SPORT_ATTRIBUTES = ('practice_m', 'practice_t')
+
+    def __init__(self):
+        self.rules = []
+        self.by_course = {}
+        self.by_attribute = {}
+        self.trigger_courses = set()
+        self.student_attributes = []
+        self.sport_attributes = []
+
+    def add_rule(self, trigger, value, course_names, take=None):
+        """Adds a rule; raises ValueError on an unknown trigger or take; call compile once all are added"""
+        if trigger != 'course' and trigger not in self.STUDENT_ATTRIBUTES + self.SPORT_ATTRIBUTES:
+            raise ValueError("Unknown expansion trigger {}".format(trigger))
+        if take is None:
+            take = len(course_names)
+        if not 0 < take <= len(course_names):
+            raise ValueError("Expansion rule {} {} takes {} of {} courses".format(
+                trigger, value, take, len(course_names)))
+        self.rules.append(ExpansionRule(len(self.rules), trigger, value, course_names, take))
+
+    def compile(self):
+        """Builds the trigger indexes from the rules"""
+        self.by_course, self.by_attribute = {}, {}
+        for rule in self.rules:
+            if rule.trigger == 'course':
+                self.by_course.setdefault(rule.value, []).append(rule)
+            else:
+                self.by_attribute.setdefault((rule.trigger, rule.value), []).append(rule)
+        self.trigger_courses = set(self.by_course)
+        triggers = {trigger for trigger, _ in self.by_attribute}
+        self.student_attributes = [name for name in self.STUDENT_ATTRIBUTES if name in triggers]
+        self.sport_attributes = [name for name in self.SPORT_ATTRIBUTES if name in triggers]
+
+    def get_matched_rules(self, student_info, sport_info, course_names):
+        """The rules a student fires in rule order; a rule fires once however many of its triggers match"""
+        matched = {}
+        for course_name in self.trigger_courses.intersection(course_names):
+            for rule in self.by_course[course_name]:
+                matched[rule.rule_id] = rule
+        for attributes, info in [(self.student_attributes, student_info), (self.sport_attributes, sport_info)]:
+            if info is None:
+                continue
+            for name in attributes:
+                for rule in self.by_attribute.get((name, getattr(info, name)), ()):
+                    matched[rule.rule_id] = rule
+        return [matched[rule_id] for rule_id in sorted(matched)]
+
+    @staticmethod
+    def select_courses(rule, number_matched):
+        """
+        The courses a rule requests for the student it matched after number_matched
+        others; a rule taking fewer than all of its courses skips a different run
+        of them for each student so the requests spread evenly
+        """
+        number_courses = len(rule.course_names)
+        if rule.take == number_courses:
+            return rule.course_names
+        skip = number_matched % number_courses
+        chosen = sorted((skip + number_courses - rule.take + index) % number_courses for index in range(rule.take))
+        return [rule.course_names[index] for index in chosen]
+
 
 class SchedulingData:
     """
     Stores the data structures for accessing and manipulating the schedule
     There are four primary data structures for accessing:
-    - Unscheduled StudentCourseRequests - list of course requests that have not been matched
+    - StudentCourseRequests - indexed store of every request, including the
+      unscheduled requests that have not been matched
     - Course info not specific to a semester/period
     - Student Data Lookup by Student
     - Course Data Lookup:
     -- Course info not specific to semester/period
     -- Course Offering Lookup by Semester->Period->Name
     -- Course Offering Lookup by Semester->Name->Period
+    The semesters and periods come from a PeriodGrid; a grid with a single
+    semester only loads and schedules that semester
     """
-    def __init__(self, number_semesters, number_periods):
-        self.unscheduled_course_requests = []
+    def __init__(self, number_semesters=3, number_periods=8, period_grid: PeriodGrid = None):
+        if period_grid is None:
+            period_grid = PeriodGrid.from_sizes(number_semesters, number_periods)
+        self.period_grid = period_grid
+        self.course_requests = CourseRequestStore()
         self.sport_info = {}
-        self.student_lookup = StudentLookupData(number_semesters)
-        self.course_data = CourseLookupData(number_semesters, number_periods)
+        self.student_lookup = StudentLookupData(period_grid)
+        self.course_data = CourseLookupData(period_grid)
+        self.prerequisites = PrerequisiteIndex(period_grid)
+        self.expansion_rules = RequestExpansionRules()
+        # {student_name: [course_name]} demand for courses that are not scheduled
+        # themselves (contact 0) but can fire expansion rules
+        self.demand_triggers = {}
+        # {(student_name, course_name): requests a prior schedule placed in the
+        # grid's semesters}, set by input_term_schedule for a grid that leaves
+        # out part of the year
+        self.term_placements = None
+
+    @property
+    def unscheduled_course_requests(self):
+        """View of the requests that have not been matched, in request order"""
+        return self.course_requests.unscheduled.values()
+
+    def check_grid_demand(self, max_unseated_share=0.05):
+        """
+        Raises ValueError when a grid that leaves out part of the year cannot
+        hold the loaded requests, e.g. when the prior schedule that selected
+        them was made for other offerings
+        max_unseated_share: share of the requests allowed beyond the seats their
+        course offers in the grid; a full year run of the shipped data has 0.24%
+        """
+        period_grid = self.period_grid
+        if period_grid.is_full_year():
+            return
+        semester_names = ", ".join(period_grid.semester_names)
+        course_requests = self.course_requests
+        if len(course_requests) == 0:
+            raise ValueError("The prior schedule places no requests in {}".format(semester_names))
+        request_course = np.frombuffer(course_requests.request_course, dtype=np.int32)
+        course_demand = np.bincount(request_course, minlength=len(course_requests.course_names))
+        course_seats = self.course_data.get_supply_matrix(course_requests.course_names).sum(axis=1)
+        unseated = int(np.maximum(course_demand - course_seats, 0).sum())
+        if unseated > max_unseated_share * len(course_requests):
+            raise ValueError("{} of the {} requests the prior schedule places in {} are beyond the seats their "
+                             "course offers in it".format(unseated, len(course_requests), semester_names))
+
+    def add_course_request(self, student_course_request: StudentCourseRequest):
+        """Registers a new request with the request store and the student"""
+        self.course_requests.add_request(student_course_request)
+        self.student_lookup.add_course_request(student_course_request)
+
+    def take_term_request(self, student_name, course_name):
+        """
+        Whether a request belongs to this run; a grid that leaves out part of
+        the year takes as many of a student's requests for a course as the
+        prior schedule placed in its semesters, see input_term_schedule
+        """
+        if self.period_grid.is_full_year():
+            return True
+        if self.term_placements is None:
+            raise ValueError("Scheduling {} alone needs the prior schedule that places requests in it".format(
+                ", ".join(self.period_grid.semester_names)))
+        number_placed = self.term_placements.get((student_name, course_name), 0)
+        if number_placed == 0:
+            return False
+        self.term_placements[(student_name, course_name)] = number_placed - 1
+        return True
+
+    def add_expanded_course_request(self, student_course_request: StudentCourseRequest):
+        """Adds a request created from the student's other requests"""
+        if self.take_term_request(student_course_request.student_name, student_course_request.course_name):
+            self.add_course_request(student_course_request)
+
+    def add_interned_course_requests(self, student_names, course_names, request_student, request_course):
+        """
+        Registers every request at once from interned columns, see CourseRequestStore.add_requests;
+        only valid before any other request is added
+        """
+        requests = self.course_requests.add_requests(student_names, course_names, request_student, request_course)
+        for student_name, request_ids in self.course_requests.by_student.items():
+            self.student_lookup.add_course_requests(student_name, [requests[i] for i in request_ids])
         
+    def input_prerequisites(self, csv_file_name):
+        """Reads the prerequisite pairs; call once the requests are loaded so they can be indexed"""
+        # Header: course, prerequisite
+        with open(csv_file_name) as csvfile:
+            prerequisite_reader = csv.reader(csvfile)
+            header = True
+
+            for row in prerequisite_reader:
+                if header:
+                    header = False
+                    continue
+                self.prerequisites.add_prerequisite(sys.intern(row[0]), sys.intern(row[1]))
+
+        self.prerequisites.build_closure()
+        self.prerequisites.index_requests(self.course_requests)
+        print("Read in {} prerequisites, {} requests are ordered by them".format(
+            sum(len(required) for required in self.prerequisites.prerequisites.values()),
+            len(self.prerequisites.fixed_mask)))
+
+    def input_term_schedule(self, csv_file_name):
+        """
+        Reads which requests a schedule written by output_student_schedules
+        placed in the grid's semesters. Demand.csv terms name semesters
+        ('Fall 2018') that span trimesters, so this is what selects the
+        requests of a grid that leaves out part of the year; requests the
+        schedule left unscheduled or placed elsewhere are not loaded. Call
+        before the demand is read
+        """
+        # Header: student, semester, course, period
+        self.term_placements = {}
+        with open(csv_file_name) as csvfile:
+            schedule_reader = csv.reader(csvfile)
+            header = True
+
+            for row in schedule_reader:
+                if header:
+                    header = False
+                    continue
+                if self.period_grid.get_semester(row[1]) is not None:
+                    key = (sys.intern(row[0]), sys.intern(row[2]))
+                    self.term_placements[key] = self.term_placements.get(key, 0) + 1
+        print("The prior schedule places {} course requests in {}".format(
+            sum(self.term_placements.values()), ", ".join(self.period_grid.semester_names)))
+
+    def input_prior_schedule(self, csv_file_name):
+        """
+        Warm start from a schedule written by output_student_schedules: each
+        request keeps the semester/period it had when that offering still
+        exists with a free seat, fits the student's other kept courses and
+        keeps the prerequisite order. Requests added to Demand.csv since, and
+        those displaced by PCO changes, are left unscheduled so only they need
+        scheduling. Call once the requests and prerequisites are loaded
+        :return: {'kept', 'new', 'displaced', 'unplaced', 'dropped'} request counts,
+        unplaced requests were unscheduled in the prior schedule and dropped ones
+        are no longer requested
+        """
+        # Header: student, semester, course, period
+        prior = {} # (student, course) -> [(semester, period) or None]
+        with open(csv_file_name) as csvfile:
+            schedule_reader = csv.reader(csvfile)
+            header = True
+
+            for row in schedule_reader:
+                if header:
+                    header = False
+                    continue
+                placement = None
+                semester = self.period_grid.get_semester(row[1]) if row[1] else None
+                if semester is None and not self.period_grid.is_full_year():
+                    # input_term_schedule only loaded the requests placed in the grid's semesters
+                    continue
+                if semester is not None and row[3] in self.period_grid.period_index:
+                    placement = (semester, self.period_grid.get_period(row[3]))
+                prior.setdefault((row[0], row[2]), []).append(placement)
+
+        counts = dict.fromkeys(['kept', 'new', 'displaced', 'unplaced', 'dropped'], 0)
+        for student_course_request in self.course_requests.requests:
+            placements = prior.get((student_course_request.student_name, student_course_request.course_name))
+            if not placements:
+                counts['new'] += 1
+                continue
+            placement = placements.pop(0)
+            if placement is None:
+                counts['unplaced'] += 1
+                continue
+            course_offering = self.course_data.lookupByPeriod[placement[0]][placement[1]].get(
+                student_course_request.course_name)
+            # sections that were removed, lost seats or now overlap a kept course
+            if course_offering is None or course_offering.number_seats_available() <= 0 or \
+                    course_offering.period_mask & self.student_lookup.get_schedule_mask(
+                        student_course_request.student_name):
+                counts['displaced'] += 1
+                continue
+            self.assign_student_to_course(student_course_request, course_offering)
+            counts['kept'] += 1
+
+        # prerequisites added since the prior schedule can reorder kept courses
+        requests = self.course_requests.requests
+        for request_id in self.prerequisites.fixed_mask:
+            student_course_request = requests[request_id]
+            if student_course_request.assigned_course is not None and \
+                    student_course_request.assigned_course.period_mask & \
+                    self.prerequisites.get_blocked_mask(request_id, requests):
+                self.unassign_student_from_course(student_course_request)
+                counts['kept'] -= 1
+                counts['displaced'] += 1
+
+        counts['dropped'] = sum(len(placements) for placements in prior.values())
+        print("Kept {kept} course requests from the prior schedule; {new} new, {displaced} displaced and "
+              "{unplaced} previously unscheduled requests remain, {dropped} prior requests were dropped".format(**counts))
+        return counts
+
     def input_course_data(self, csv_file_name):
         # Header: dept, subject, course number, credits, contact, periods, core, min, max
         with open(csv_file_name) as csvfile:
@@ -110,7 +698,7 @@ class SchedulingData:
                     header = False
                     continue
                 # course_name, dept, credits, contact, min_seats, max_seats
-                course_name = row[1] + " " + row[2]
+                course_name = sys.intern(row[1] + " " + row[2])
                 course = \
                 Course(course_name, row[0], row[3], int(row[5]), row[7], row[8])
                 
@@ -128,7 +716,7 @@ class SchedulingData:
                     header = False
                     continue
                     
-                student_info = Student(row[0], row[1], row[5], row[6])
+                student_info = Student(sys.intern(row[0]), row[1], row[5], row[6])
                 
                 self.student_lookup.add_student_info(student_info)
                 
@@ -148,18 +736,22 @@ class SchedulingData:
                     header = False
                     continue
                 
-                if self.course_data.courses[row[10]].contact == 0:
-                    continue
-                    
                 if row[1][:6] == "Summer":
                     if row[6] in ['Space', 'Cyber', 'ArmnShp', 'UAS']:
                         # Only scheduling these courses if in Fall/Spring
                         continue
+
+                if self.course_data.courses[row[10]].contact == 0:
+                    # e.g. the ArmnShp independent courses, requested through their trimester parts
+                    self.demand_triggers.setdefault(sys.intern(row[0]), []).append(sys.intern(row[10]))
+                    continue
+
+                if not self.take_term_request(row[0], row[10]):
+                    continue
                     
-                student_course_request = StudentCourseRequest(row[0], row[10])
+                student_course_request = StudentCourseRequest(sys.intern(row[0]), sys.intern(row[10]))
                 
-                self.student_lookup.add_course_request(student_course_request)
-                self.unscheduled_course_requests.append(student_course_request)
+                self.add_course_request(student_course_request)
 
     def input_pco(self, csv_file_name):
         # Header: Dept, Course, Contact, Semester, Period, Sections, Max
@@ -173,28 +765,21 @@ class SchedulingData:
                     header = False
                     continue
                 
-                # Translate semester to integer
-                if row[3] == "Fall":
-                    semester = 0
-                elif row[3] == "Winter":
-                    semester = 1
-                else:
-                    semester = 2
-                    
-                # Translate period to integer
-                if row[4][0] == "M":
-                    period = int(row[4][1])-1 # M-day
-                else:
-                    period = int(row[4][1])+3 # T-day
+                # Translate semester and period to integers; semesters left out of the grid are skipped
+                semester = self.period_grid.get_semester(row[3])
+                if semester is None:
+                    continue
+                period = self.period_grid.get_period(row[4])
                     
                 # Number of seats
                 num_seats = int(row[5])*int(row[6])
                 
-                course_offering = CourseOffering(row[1], semester, period, num_seats, self.course_data.courses[row[1]])
+                course_offering = CourseOffering(sys.intern(row[1]), semester, period, num_seats, self.course_data.courses[row[1]])
                 self.course_data.add_course_offering(course_offering)
                 
                 row_num += 1
                 
+        self.course_data.build_course_index()
         print("Read in {} course offerings".format(row_num))
         
     def input_sport_data(self, csv_file_name):
@@ -210,93 +795,145 @@ class SchedulingData:
                     
                 if (row[0], row[1]) not in self.sport_info:
                     # Determine offseason
-                    if row[4] == "Fall":
-                        offseason = 0
-                    elif row[4] == "Winter":
-                        offseason = 1
-                    else:
-                        offseason = 2
+                    offseason = self.period_grid.get_year_semester(row[4])
                     
                 self.sport_info[(row[0], row[1])] = \
                 SportInfo(row[0], row[1], row[2], row[3], offseason)
                 
-    def add_pe_courses(self):
-        # pe_lookup = {
-        # ('practice_m', 'AM'): ['PhyEd 711','PhyEd 712','PhyEd 721','PhyEd 722','PhyEd 731','PhyEd 732'],
-        # ('practice_t', 'AM'): ['PhyEd 715','PhyEd 716','PhyEd 725','PhyEd 726','PhyEd 735','PhyEd 736'],
-        # ('practice_m', 'PM'): ['PhyEd 714','PhyEd 713','PhyEd 724','PhyEd 723','PhyEd 734','PhyEd 733'],
-        # ('practice_t', 'PM'): ['PhyEd 718','PhyEd 717','PhyEd 728','PhyEd 727','PhyEd 738','PhyEd 737']
-        # }
-        pe_ic_lookup = {
-        ('practice_m', 'AM'): ['PhyEd 711F','PhyEd 711W','PhyEd 711S'],
-        ('practice_t', 'AM'): ['PhyEd 715F','PhyEd 715W','PhyEd 715S'],
-        ('practice_m', 'PM'): ['PhyEd 714F','PhyEd 714W','PhyEd 714S'],
-        ('practice_t', 'PM'): ['PhyEd 718F','PhyEd 718W','PhyEd 718S']
-        }
-        pe_lookup = ['PhyEd 700F','PhyEd 700W','PhyEd 700S']
-        num = 0
+    def input_expansion_rules(self, csv_file_name):
+        """Reads the rules that generate requests, such as PE for each trimester; call after input_course_data"""
+        # Header: trigger, value, courses (separated by ;), take
+        self.expansion_rules = RequestExpansionRules()
+        with open(csv_file_name) as csvfile:
+            rule_reader = csv.reader(csvfile)
+            header = True
+
+            for row in rule_reader:
+                if header:
+                    header = False
+                    continue
+                course_names = [sys.intern(course_name.strip()) for course_name in row[2].split(";")
+                                if course_name.strip()]
+                for course_name in course_names:
+                    if course_name not in self.course_data.courses:
+                        raise ValueError("Expansion rule {} {} requests unknown course {}".format(
+                            row[0], row[1], course_name))
+                take = int(row[3]) if len(row) > 3 and row[3] else None
+                self.expansion_rules.add_rule(row[0], sys.intern(row[1]), course_names, take)
+
+        self.expansion_rules.compile()
+        print("Read in {} expansion rules".format(len(self.expansion_rules.rules)))
+
+    def expand_course_requests(self):
+        """
+        Adds the requests the expansion rules generate for every student with
+        demand in a single pass; rules fire on the loaded requests and on the
+        demand for contact 0 courses, never on requests another rule generated
+        """
+        rules = self.expansion_rules
+        number_matched = [0] * len(rules.rules)
+        number_requests = len(self.course_requests)
         for student, val in self.student_lookup.students.items():
-            if not self.student_lookup.students[student]['requests']:
+            triggers = self.demand_triggers.get(student, ())
+            if not val.requests and not triggers:
                 continue
-            if val['info'].sport == "":
-                for i in range(3):
-                    if i != num:
-                        student_course_request = StudentCourseRequest(student, pe_lookup[i])
-                        
-                        self.student_lookup.add_course_request(student_course_request)
-                        self.unscheduled_course_requests.append(student_course_request)
-                num += 1
-                if num > 2:
-                    num = 0
-            else:
-                for day in ['practice_m', 'practice_t']:
-                    time = getattr(self.sport_info[(val['info'].sport, val['info'].gender)], day)
-                    off = self.sport_info[(val['info'].sport, val['info'].gender)].offseason
-                    for pos, pe in enumerate(pe_ic_lookup[(day, time)]):
-                        # if 2*off+1 == pos:
-                            # continue
-                        
-                        student_course_request = StudentCourseRequest(student, pe)
-                        
-                        self.student_lookup.add_course_request(student_course_request)
-                        self.unscheduled_course_requests.append(student_course_request)
-                        
-    def add_armnshp_courses(self):
-        ip_lookup = {
-        'ArmnShp 461': ['ArmnShp 461F', 'ArmnShp 461W', 'ArmnShp 461S'],
-        'ArmnShp 465': ['ArmnShp 465F', 'ArmnShp 465W', 'ArmnShp 465S'],
-        'ArmnShp 474': ['ArmnShp 474F', 'ArmnShp 474W', 'ArmnShp 474S'],
-        'ArmnShp 475': ['ArmnShp 475F', 'ArmnShp 475W', 'ArmnShp 475S'],
-        'ArmnShp 491': ['ArmnShp 491F', 'ArmnShp 491W', 'ArmnShp 491S'],
-        'ArmnShp 496': ['ArmnShp 496F', 'ArmnShp 496W', 'ArmnShp 496S']
-        }
-        ip = ['ArmnShp 461','ArmnShp 465','ArmnShp 474','ArmnShp 475','ArmnShp 491','ArmnShp 496']
-        for student, val in self.student_lookup.students.items():
-            for item in val['requests']:
-                if item in ip:
-                    for request in ip_lookup[item]:
-                        student_course_request = StudentCourseRequest(student, request)
-                        
-                        self.student_lookup.add_course_request(student_course_request)
-                        self.unscheduled_course_requests.append(student_course_request)
-                    break
-                
+            info = val.info
+            sport_info = None if info is None else self.sport_info.get((info.sport, info.gender))
+            course_names = [request.course_name for request in val.requests]
+            course_names.extend(triggers)
+            for rule in rules.get_matched_rules(info, sport_info, course_names):
+                for course_name in rules.select_courses(rule, number_matched[rule.rule_id]):
+                    self.add_expanded_course_request(StudentCourseRequest(student, course_name))
+                number_matched[rule.rule_id] += 1
+        print("Added {} expanded course requests".format(len(self.course_requests) - number_requests))
+
 
     def assign_student_to_course(self, student_course_request: StudentCourseRequest, course_offering: CourseOffering):
         # Attach student course request to the course offering (and decrement counter)
-        course_offering.students_enrolled.append(student_course_request)
+        course_offering.students_enrolled.add(student_course_request.request_id)
+        self.course_data.take_seat(course_offering)
         # Attach offering to the course request
         student_course_request.assigned_course = course_offering
-        # Remove from the unassigned list
-        self.unscheduled_course_requests.remove(student_course_request)
+        # Mark the offering's periods as busy for the student
+        self.student_lookup.occupy_periods(student_course_request.student_name, course_offering.period_mask)
+        # Remove from the unassigned set
+        self.course_requests.mark_scheduled(student_course_request)
 
-    def remove_student_from_course(self, student_name, semester, course_name, period):
-        student_course_request: StudentCourseRequest = \
-            self.student_lookup.students[student_name]['requests'] # how to find StudentCourseRequest in list?
-        course_offering:CourseOffering = self.course_data.lookupByClassID[semester][course_name][period]
-        course_offering.students_enrolled.remove(student_course_request)
+    def unassign_student_from_course(self, student_course_request: StudentCourseRequest):
+        # Detach the request from its offering and return it to the unassigned set
+        course_offering: CourseOffering = student_course_request.assigned_course
+        if course_offering is None:
+            return
+        course_offering.students_enrolled.remove(student_course_request.request_id)
+        self.course_data.return_seat(course_offering)
+        self.student_lookup.release_periods(student_course_request.student_name, course_offering.period_mask)
         student_course_request.assigned_course = None
-        self.unscheduled_course_requests.append(student_course_request)
+        self.course_requests.mark_unscheduled(student_course_request)
+
+    def change_offering_seats(self, course_name, semester, period, number_seats):
+        """
+        Adds seats to a course's offering at semester/period, creating the
+        offering when the course does not meet then, or removes them when
+        number_seats is negative. Requests enrolled beyond the seats left are
+        unassigned, the most recent requests first
+        :return: [StudentCourseRequest] unassigned by the change
+        """
+        course_offering = self.course_data.lookupByPeriod[semester][period].get(course_name)
+        if course_offering is None:
+            course_offering = CourseOffering(course_name, semester, period, 0, self.course_data.courses[course_name])
+            self.course_data.add_course_offering(course_offering)
+        course_offering.number_seats_total = max(course_offering.number_seats_total + number_seats, 0)
+        # the per-course index only holds offerings with seats
+        self.course_data.course_index = None
+
+        number_displaced = max(-course_offering.number_seats_available(), 0)
+        displaced = [self.course_requests.get_request(request_id) for request_id in
+                     sorted(course_offering.students_enrolled, reverse=True)[:number_displaced]]
+        for student_course_request in displaced:
+            self.unassign_student_from_course(student_course_request)
+        return displaced
+
+    def remove_student_from_course(self, student_name, semester, course_name, period):
+        course_offering: CourseOffering = self.course_data.lookupByClassID[semester][course_name][period]
+        for request_id in self.course_requests.by_student.get(student_name, []):
+            student_course_request: StudentCourseRequest = self.course_requests.get_request(request_id)
+            if student_course_request.course_name == course_name and \
+                    student_course_request.assigned_course is course_offering:
+                self.unassign_student_from_course(student_course_request)
+                return student_course_request
+        return None
+
+    def clear_assignments(self):
+        """Returns every assigned request to the unassigned set"""
+        for student_course_request in self.course_requests.requests:
+            if student_course_request.assigned_course is not None:
+                self.unassign_student_from_course(student_course_request)
+
+    def get_assignment_array(self):
+        """
+        Compact copy of the current assignments, used to pass schedules between processes
+        :return: numpy array indexed by request_id holding the assigned
+        semester * number_periods + period, or -1 when the request is unassigned
+        """
+        number_periods = self.course_data.number_periods
+        return np.fromiter(
+            (-1 if request.assigned_course is None else
+             request.assigned_course.semester * number_periods + request.assigned_course.period
+             for request in self.course_requests.requests),
+            dtype=np.int16, count=len(self.course_requests))
+
+    def apply_assignment_array(self, assignments):
+        """
+        Assigns the requests of an array from get_assignment_array; requests
+        that are already assigned should be cleared first
+        """
+        number_periods = self.course_data.number_periods
+        for request_id in np.flatnonzero(assignments >= 0).tolist():
+            student_course_request = self.course_requests.get_request(request_id)
+            semester, period = divmod(int(assignments[request_id]), number_periods)
+            self.assign_student_to_course(
+                student_course_request,
+                self.course_data.lookupByPeriod[semester][period][student_course_request.course_name])
 
     def print_unscheduled_report(self):
         for item in self.unscheduled_course_requests:
@@ -304,29 +941,74 @@ class SchedulingData:
 
 
 
+class CourseCapacity:
+    """Stores the offerings of a single course across every semester/period"""
+    def __init__(self, course_name):
+        self.course_name = course_name
+        self.offerings = [] # CourseOffering with seats, in semester/period order
+        self.periods = () # (semester, period) of each offering
+        self.slots = () # (position in seat_counts, period_mask, semester, period) of each offering
+        self.number_periods = 0
+        self.number_seats = 0
+        self.period_mask = 0 # bits of every semester/period the course meets
+
+
 class CourseLookupData:
     """
     Lookup data structures for courses by period/semester
     self.courses{course}
     lookupByPeriod:  [semester]->[periods]->{courseID}<-course_offering
     lookupByClassID:  [semester]->{courseID}->[period]<-course_offerings
+    course_index:  {courseID}<-CourseCapacity, rebuilt after offerings change
+    offerings:  [offering_id]<-course_offering
+    seats_remaining:  numpy view [course_id][semester][period] of the seats left in the
+        offering starting there, 0 where there is none; built with the index and kept
+        live by take_seat and return_seat
+    slot_masks:  numpy array [course_id][semester][period] of the offering's period_mask
     """
-    def __init__(self, number_semesters, number_periods):
+    def __init__(self, period_grid: PeriodGrid):
         self.courses = {}
         self.lookupByPeriod = []
         self.lookupByClassID = []
-        self.number_periods = number_periods
-        for i in range(number_semesters):
+        self.course_index = None
+        self.offerings = [] # offering_id -> CourseOffering
+        # seats_remaining is stored flat in an array so one seat is a cheap item update
+        self.seat_counts = None
+        self.seat_shape = None
+        self.seat_index = None # [offering_id] -> position in seat_counts
+        self.slot_masks = None
+        self.period_grid = period_grid
+        self.number_periods = period_grid.number_periods
+        for i in range(period_grid.number_semesters):
             self.lookupByPeriod.append([])  # semesters
             self.lookupByClassID.append({})
-            for j in range(number_periods):
+            for j in range(self.number_periods):
                 self.lookupByPeriod[i].append({})  # periods
                 
     def add_course_data(self, course_info: Course):
+        if course_info.course_name in self.courses:
+            course_info.course_id = self.courses[course_info.course_name].course_id
+        else:
+            course_info.course_id = len(self.courses)
         self.courses[course_info.course_name] = course_info
 
+    def get_period_mask(self, semester, period, contact):
+        """
+        Returns the occupancy bits for an offering starting at semester/period
+        Bit semester*number_periods + period is set for each period the offering
+        meets, so a double period (contact == 2) also covers period + 1 of the same day
+        """
+        return self.period_grid.get_period_mask(semester, period, contact)
+
     def add_course_offering(self, course_offering: CourseOffering):
-        self.lookupByPeriod[course_offering.semester][course_offering.period][course_offering.course_name] = course_offering
+        # any change to the offerings invalidates the per-course index
+        self.course_index = None
+        course_offering.period_mask = self.get_period_mask(
+            course_offering.semester, course_offering.period, course_offering.course_info.contact)
+        if course_offering.course_name not in self.lookupByPeriod[course_offering.semester][course_offering.period]:
+            course_offering.offering_id = len(self.offerings)
+            self.offerings.append(course_offering)
+            self.lookupByPeriod[course_offering.semester][course_offering.period][course_offering.course_name] = course_offering
         if course_offering.course_name not in self.lookupByClassID[course_offering.semester]:
             self.lookupByClassID[course_offering.semester][course_offering.course_name] = []
             # temp = self.lookupByClassID[course_offering.semester][course_offering.course_name]
@@ -341,20 +1023,147 @@ class CourseLookupData:
     def get_course(self, semester, course_name):
         return self.lookupByClassID[semester][course_name]
 
+    def build_course_index(self):
+        """
+        Builds the CourseCapacity for every offered course in one pass over the
+        offerings; only offerings with seats are included
+        """
+        self.course_index = {}
+        for ind, semester in enumerate(self.lookupByClassID):
+            for course_name, offerings in semester.items():
+                if course_name not in self.course_index:
+                    self.course_index[course_name] = CourseCapacity(course_name)
+                capacity = self.course_index[course_name]
+                for offering in offerings:
+                    if offering is not None and offering.number_seats_total > 0:
+                        capacity.offerings.append(offering)
+                        capacity.number_periods += 1
+                        capacity.number_seats += offering.number_seats_total
+                        capacity.period_mask |= offering.period_mask
+        for capacity in self.course_index.values():
+            capacity.periods = tuple((offering.semester, offering.period) for offering in capacity.offerings)
+        self.build_seat_matrix()
+
+    def build_seat_matrix(self):
+        """Fills seats_remaining and slot_masks from the offerings"""
+        shape = self.seat_shape = (len(self.courses), len(self.lookupByPeriod), self.number_periods)
+        seats = np.zeros(shape, dtype=np.int32)
+        self.slot_masks = np.zeros(shape, dtype=self.mask_dtype)
+        self.seat_index = [0] * len(self.offerings)
+        for offering in self.offerings:
+            index = (offering.course_info.course_id, offering.semester, offering.period)
+            # offerings left out of the index have no seats to offer, so they are never chosen
+            seats[index] = offering.number_seats_available()
+            self.slot_masks[index] = offering.period_mask
+            self.seat_index[offering.offering_id] = int(np.ravel_multi_index(index, shape))
+        self.seat_counts = array('i', seats.tobytes())
+        for capacity in self.course_index.values():
+            capacity.slots = tuple((self.seat_index[offering.offering_id], offering.period_mask,
+                                    offering.semester, offering.period) for offering in capacity.offerings)
+
+    @property
+    def mask_dtype(self):
+        # masks of grids past 63 slots do not fit an int64
+        return np.int64 if self.period_grid.number_slots < 64 else object
+
+    @property
+    def seats_remaining(self):
+        if self.seat_counts is None:
+            return None
+        return np.frombuffer(self.seat_counts, dtype=np.int32).reshape(self.seat_shape)
+
+    def refresh_seats(self):
+        """Recounts seats_remaining after offerings' number_seats_total was changed in place"""
+        if self.course_index is None:
+            self.build_course_index()
+        else:
+            self.build_seat_matrix()
+
+    def get_seats_remaining(self):
+        """seats_remaining, building the index if the offerings changed since it was last built"""
+        if self.course_index is None:
+            self.build_course_index()
+        return self.seats_remaining
+
+    def get_seats_left(self, course_offering: CourseOffering):
+        """seats_remaining of one indexed offering"""
+        if self.course_index is None:
+            self.build_course_index()
+        return self.seat_counts[self.seat_index[course_offering.offering_id]]
+
+    def take_seat(self, course_offering: CourseOffering):
+        # a stale matrix is rebuilt from the enrolled counts with the index
+        if self.course_index is not None:
+            self.seat_counts[self.seat_index[course_offering.offering_id]] -= 1
+
+    def return_seat(self, course_offering: CourseOffering):
+        if self.course_index is not None:
+            self.seat_counts[self.seat_index[course_offering.offering_id]] += 1
+
+    def choose_slots(self, course_name, busy_masks, semester_loads):
+        """
+        Chooses the slot of each of a batch of requests for one course in one
+        masked pass, with the greedy loop's rule: the least loaded semester
+        with a free offering that has a seat, then that semester's period with
+        the most seats; ties go to the earlier semester and period
+        :param busy_masks: numpy array [request] of the slots each request may not use, of dtype mask_dtype
+        :param semester_loads: numpy array [request][semester] of busy periods
+        :return: (semesters, periods) numpy arrays [request], -1 where no offering is free
+        """
+        course_id = self.courses[course_name].course_id
+        seats = np.where((self.slot_masks[course_id] & busy_masks[:, None, None]) != 0,
+                         0, self.get_seats_remaining()[course_id])
+        periods = seats.argmax(axis=2)
+        best_seats = seats.max(axis=2)
+        # lowest load first, then most seats
+        key = np.where(best_seats > 0, semester_loads.astype(np.int64) * (1 << 32) - best_seats,
+                       np.iinfo(np.int64).max)
+        semesters = key.argmin(axis=1)
+        rows = np.arange(len(semesters))
+        placed = best_seats[rows, semesters] > 0
+        return np.where(placed, semesters, -1), np.where(placed, periods[rows, semesters], -1)
+
+    def choose_slot(self, course_name, busy_mask, semester_load):
+        """
+        choose_slots for a single request, scanning the course's slots of the
+        seat matrix; a batch of one costs more in numpy than the scan
+        :param busy_mask: slots the request may not use
+        :param semester_load: [semester] of busy periods
+        :return: (semester, period), or None when no offering is free
+        """
+        seat_counts = self.seat_counts
+        best = None
+        best_key = None
+        for position, period_mask, semester, period in self.get_course_capacity(course_name).slots:
+            if period_mask & busy_mask:
+                continue
+            seats = seat_counts[position]
+            if seats > 0:
+                # lowest load first, then most seats; slots are in semester/period order
+                key = (semester_load[semester] << 32) - seats
+                if best is None or key < best_key:
+                    best_key = key
+                    best = (semester, period)
+        return best
+
+    def get_course_capacity(self, course_name):
+        """
+        Returns the CourseCapacity of a course, building the index if the
+        offerings changed since it was last built
+        """
+        if self.course_index is None:
+            self.build_course_index()
+        if course_name not in self.course_index:
+            return CourseCapacity(course_name)
+        return self.course_index[course_name]
+
     def get_course_periods_available(self, course_name):
         """
-        Gets the number of seats available per period for a course/semester pair
+        Gets the semester/period pairs a course is offered with seats
         :param course_name: course_name of interest
-        :return: [(semester, period)]
+        :return: ((semester, period))
         """
-        offering_list = []
-        for ind, semester in enumerate(self.lookupByClassID):
-            if course_name in semester:
-                for offering in semester[course_name]:
-                    if offering is not None:
-                        if offering.number_seats_total > 0:
-                            offering_list.append((ind, offering.period))
-        return offering_list
+        return self.get_course_capacity(course_name).periods
 
     def print_course_offering_report(self, semester, course_name):
         course_info = self.lookupByClassID[semester][course_name]
@@ -367,7 +1176,7 @@ class CourseLookupData:
                 print(semester, course_name, period_offering.period, period_offering.number_seats_total)
 
     def print_semester_course_report(self, semester):
-        for course in self.lookupByClassID[semester].items():
+        for course in self.lookupByClassID[semester].values():
             for period_offering in course:
                 if period_offering is not None:
                     print(semester, period_offering.course_name, period_offering.period, period_offering.number_seats_total)
@@ -378,48 +1187,76 @@ class CourseLookupData:
         :param course_name:
         :return: (number of periods, number of seats available)
         """
-        num_periods = 0
-        num_seats = 0
-        for semester in self.lookupByClassID:
-            if course_name in semester:
-                for offering in semester[course_name]:
-                    if offering is not None:
-                        if offering.number_seats_total > 0:
-                            num_periods += 1
-                            num_seats += offering.number_seats_total
-        return num_periods, num_seats
+        capacity = self.get_course_capacity(course_name)
+        return capacity.number_periods, capacity.number_seats
+
+    def get_supply_matrix(self, course_names):
+        """
+        Seats still available in each course by the semester/period its offerings start
+        :param course_names: row order of the matrix, e.g. the request store's interned course names
+        :return: numpy array [course][semester*number_periods + period] of seats
+        """
+        course_ids = np.array([self.courses[course_name].course_id for course_name in course_names], dtype=np.int64)
+        supply = self.get_seats_remaining()[course_ids].reshape(len(course_names), self.period_grid.number_slots)
+        return np.maximum(supply, 0).astype(np.int64)
+
+
+class StudentRecord:
+    """
+    Stores everything known about one student
+    record['info'] style access is kept for code written against the old dict layout
+    """
+    __slots__ = ('student_id', 'info', 'requests', 'schedule_mask')
+
+    def __init__(self, student_id, info=None):
+        self.student_id = student_id
+        self.info = info # Student, None if only known from requests
+        self.requests = [] # [StudentCourseRequest]
+        self.schedule_mask = 0 # bits of busy semester/periods
+
+    def __getitem__(self, key):
+        return getattr(self, key)
 
 
 class StudentLookupData:
     """
     Stores students as a dictionary for easy retrieval by-name
-    self.students{student_name}{'info'} <- Student
-    self.students{student_name}{'requests'} <- [course_request]
+    self.students{student_name} <- StudentRecord
+    self.students{student_name}.info <- Student
+    self.students{student_name}.requests <- [course_request]
+    self.students{student_name}.schedule_mask <- bits of busy semester/periods
+    self.student_names[student_id] <- student_name
     """
 
-    def __init__(self, number_semesters):
+    def __init__(self, period_grid: PeriodGrid):
         self.students = {}
-        self.number_semesters = number_semesters
+        self.student_names = []
+        self.period_grid = period_grid
+        self.number_semesters = period_grid.number_semesters
+        self.number_periods = period_grid.number_periods
+        self.semester_mask = period_grid.semester_mask
+
+    def get_student_record(self, student_name):
+        """Returns the student's StudentRecord, creating it on first use"""
+        if student_name not in self.students:
+            self.students[student_name] = StudentRecord(len(self.student_names))
+            self.student_names.append(student_name)
+        return self.students[student_name]
         
     def add_student_info(self, student_info: Student):
         """Adds the student info to the student"""
         if student_info.student_name not in self.students:
-            self.students[student_info.student_name] = {
-            'info': student_info,
-            'requests': []
-            }
+            self.get_student_record(student_info.student_name).info = student_info
 
     def add_course_request(self, student_course_request: StudentCourseRequest):
         """
         Adds the course request to the student
         """
-        if student_course_request.student_name not in self.students:
-            self.students[student_course_request.student_name] = {
-            'info': None,
-            'requests': []
-            }
+        self.get_student_record(student_course_request.student_name).requests.append(student_course_request)
 
-        self.students[student_course_request.student_name]['requests'].append(student_course_request)
+    def add_course_requests(self, student_name, student_course_requests):
+        """Adds several course requests of one student"""
+        self.get_student_record(student_name).requests.extend(student_course_requests)
 
     def list_periods_scheduled(self, student_name):
         """
@@ -429,29 +1266,46 @@ class StudentLookupData:
         :param student_name: ID of student
         :return: [(semester, period)]
         """
-        courses = self.students[student_name]['requests'] # list of student course requests
+        schedule_mask = self.students[student_name].schedule_mask
         periods = []
-        for course in courses:
-            if course.assigned_course is not None:
-                periods.append((course.assigned_course.semester, course.assigned_course.period))
-                
-                if course.assigned_course.course_info.contact == 2:
-                    periods.append((course.assigned_course.semester, course.assigned_course.period + 1))
-                    
+        for semester in range(self.number_semesters):
+            for period in range(self.number_periods):
+                if schedule_mask >> (semester * self.number_periods + period) & 1:
+                    periods.append((semester, period))
+
         return periods
 
+    def get_schedule_mask(self, student_name):
+        return self.students[student_name].schedule_mask
+
+    def occupy_periods(self, student_name, period_mask):
+        self.students[student_name].schedule_mask |= period_mask
+
+    def release_periods(self, student_name, period_mask):
+        self.students[student_name].schedule_mask &= ~period_mask
+
+    def get_course_load_by_semester(self, student_name):
+        """
+        Counts the periods a student is busy in each semester
+        :param student_name: ID of student
+        :return: [busy periods] indexed by semester
+        """
+        schedule_mask = self.students[student_name].schedule_mask
+        return [(schedule_mask >> (semester * self.number_periods) & self.semester_mask).bit_count()
+                for semester in range(self.number_semesters)]
+
     def print_student_schedule(self, student_name):
-        courses = self.students[student_name]['requests']
+        courses = self.students[student_name].requests
         for course in courses:
             if course.assigned_course is None:
                 print(course.course_name, "NOT ASSIGNED")
             else:
-                print(course.course_name, "@", course.assigned_course.semester_lookup[course.assigned_course.semester], "period", course.assigned_course.period_lookup[course.assigned_course.period])
+                print(course.course_name, "@", self.period_grid.semester_names[course.assigned_course.semester], "period", self.period_grid.period_labels[course.assigned_course.period])
 
     def print_all_schedules(self, semester):
         for key, val in self.students.items():
             print("{} in Semester {}".format(key,semester))
-            for course_request in val['requests']:
+            for course_request in val.requests:
                 if course_request.assigned_course is None:
                     print(course_request.course_name,"***Not Assigned***")
                 elif course_request.assigned_course.semester == semester:
@@ -466,32 +1320,33 @@ class StudentLookupData:
             schedule_writer.writerow(header)
             
             for key, val in self.students.items():
-                for course_request in val['requests']:
+                for course_request in val.requests:
                     row = [key] # Student name
                     if course_request.assigned_course is None:
                         row.append("") # semester
                         row.append(course_request.course_name)
                         row.append("") # period
                     else:
-                        row.append(course_request.assigned_course.semester_lookup[course_request.assigned_course.semester])
+                        row.append(self.period_grid.semester_names[course_request.assigned_course.semester])
                         row.append(course_request.course_name)
-                        row.append(course_request.assigned_course.period_lookup[course_request.assigned_course.period])
+                        row.append(self.period_grid.period_labels[course_request.assigned_course.period])
                         
                     schedule_writer.writerow(row)
 
     def get_number_courses(self, student_name):
-        return len(self.students[student_name])
+        return len(self.students[student_name].requests)
         
-    def get_flexibility(self, student_name):
+    def get_flexibility(self, student_name, courses):
         """
         calculates student scheduling flexibility for a given academic year:
-        24 AY periods - the number of sections a student needs to be scheduled
+        AY periods of the grid (24 for 3x8) - the number of periods a student needs to be scheduled
         :param student_name: ID of student
-        :returns an integer from 0-15 (assuming 9 is the min AY course load
+        :param courses: {course_name} <- Course, e.g. CourseLookupData.courses
+        :returns an integer from 0 to the grid's slots less the minimum course load, 0-15 on
+        the 3x8 grid where 9 is the min AY course load
         """
         periods = 0
-        courses = self.students[student_name]
-        for course in courses:
-            periods += course.number_periods # doesnt work without Course object
+        for course in self.students[student_name].requests:
+            periods += courses[course.course_name].contact
             
-        return (24 - periods)
\ No newline at end of file
+        return (self.period_grid.number_slots - periods)
\ No newline at end of file
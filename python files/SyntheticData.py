@@ -0,0 +1,258 @@
+import argparse
+import csv
+import math
+import os.path
+import numpy as np
+
+# Writes seeded, synthetic Cadets/Courses/PCO/Sports/Demand/Expansion Rules files with the
+# same columns as the shipped inputs so the scheduler can be measured at sizes
+# beyond one academic year
+
+SEMESTERS = ["Fall", "Winter", "Spring"]
+PERIODS = ["M1", "M2", "M3", "M4", "T1", "T2", "T3", "T4"]
+SUBJECTS = ["AeroEngr", "Astro", "Biology", "Chem", "CompSci", "Econ", "ECE", "English",
+            "Geo", "History", "Law", "Math", "MechEngr", "Mgt", "Philos", "Physics", "PolSci", "Soc"]
+SPORTS = ["BA", "BB", "CC", "DV", "FB", "FE", "GY", "IH", "LC", "RI", "SO", "SW", "TE", "TR", "VB", "WR"]
+
+# about the size of the shipped academic year
+BASE_CADETS = 5600
+
+# name: (multiple of BASE_CADETS, mean course requests per cadet)
+SCALES = {
+    '1x': (1, 10),
+    '5x': (5, 10),
+    '20x': (20, 10),
+    'dense': (1, 14),
+}
+
+# PE courses the expansion rules request for athletes, keyed by practice day and time
+PE_IC_COURSES = {
+    ('practice_m', 'AM'): 'PhyEd 711',
+    ('practice_t', 'AM'): 'PhyEd 715',
+    ('practice_m', 'PM'): 'PhyEd 714',
+    ('practice_t', 'PM'): 'PhyEd 718',
+}
+ARMNSHP_COURSES = ['ArmnShp 461', 'ArmnShp 465']
+
+
+class SyntheticData:
+    """
+    Generates one academic year of inputs
+    number_cadets: cadets written to Cadets.csv, all of them request courses
+    requests_per_cadet: mean number of Demand.csv rows per cadet
+    number_courses: size of the academic course catalog (PE and ArmnShp are added to it)
+    seat_slack: seats offered per requested seat
+    """
+
+    def __init__(self, number_cadets, requests_per_cadet=10, number_courses=800, seed=0, seat_slack=1.15):
+        self.number_cadets = number_cadets
+        self.requests_per_cadet = requests_per_cadet
+        self.number_courses = number_courses
+        self.seat_slack = seat_slack
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_scale(cls, scale, seed=0):
+        """Generator for one of the SCALES presets"""
+        multiple, requests_per_cadet = SCALES[scale]
+        return cls(BASE_CADETS * multiple, requests_per_cadet, seed=seed)
+
+    def write(self, output_directory):
+        """Writes the six input files into output_directory and returns the number of Demand.csv rows"""
+        os.makedirs(output_directory, exist_ok=True)
+        sports = self.generate_sports()
+        courses = self.generate_courses()
+        cadets = self.generate_cadets(sports)
+        demand = self.generate_demand(cadets, courses)
+        offerings = self.generate_offerings(courses, demand, cadets, sports)
+
+        self.write_csv(os.path.join(output_directory, "Sports.csv"),
+                       ["Sport Code", "Gender", "PracticeM", "PracticeT", "Off Season"], sports)
+        self.write_csv(os.path.join(output_directory, "Courses.csv"),
+                       ["Dept", "Subject", "CourseNumber", "Credits", "Contact", "Periods", "Core", "Min",
+                        "Max", "DF", "Lookup", "Summer", "CourseCode"],
+                       [[course['dept'], course['subject'], course['number'], "3", course['contact'],
+                         course['contact'], "", "1", course['max'], "0", course['name'], "0",
+                         course['subject'] + course['number']] for course in courses])
+        self.write_csv(os.path.join(output_directory, "Cadets.csv"),
+                       ["Cadet PID", "Year", "Squadron", "Major", "Sec Major", "Sport Code", "Sport Gender"],
+                       cadets)
+        self.write_csv(os.path.join(output_directory, "PCO.csv"),
+                       ["Dept", "Course Lookup", "Contact", "Semester", "Period", "Sections", "Max"], offerings)
+        self.write_csv(os.path.join(output_directory, "Demand.csv"),
+                       ["Cadet PID", "Course Term", "Course", "Sec1", "Sec2", "Period", "Subject", "Number",
+                        "Course Number", "Suffix", "Course Lookup"], demand)
+        self.write_csv(os.path.join(output_directory, "Expansion Rules.csv"),
+                       ["Trigger", "Value", "Courses", "Take"], self.generate_expansion_rules())
+        return len(demand)
+
+    @staticmethod
+    def write_csv(file_name, header, rows):
+        with open(file_name, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    @staticmethod
+    def generate_expansion_rules():
+        """Rows of Expansion Rules.csv for the generated PE and ArmnShp courses"""
+        def trimesters(course_name):
+            return ";".join(course_name + suffix for suffix in "FWS")
+
+        rules = [["sport", "", trimesters("PhyEd 700"), "2"]]
+        rules.extend([day, time, trimesters(course_name), ""] for (day, time), course_name in PE_IC_COURSES.items())
+        rules.extend(["course", course_name, trimesters(course_name), ""] for course_name in ARMNSHP_COURSES)
+        return rules
+
+    def generate_sports(self):
+        """Rows of Sports.csv, mostly afternoon practices"""
+        sports = []
+        for sport in SPORTS:
+            for gender in [["M"], ["F"], ["M", "F"]][self.rng.choice(3, p=[0.3, 0.2, 0.5])]:
+                practice = ["AM" if self.rng.random() < 0.15 else "PM" for _ in range(2)]
+                sports.append([sport, gender, practice[0], practice[1], SEMESTERS[self.rng.integers(3)]])
+        return sports
+
+    def generate_courses(self):
+        """
+        Course catalog as dicts; 'weight' is the share of requests a course draws,
+        a heavy-tailed popularity with some courses that are never requested
+        """
+        courses = []
+        for index in range(self.number_courses):
+            subject = SUBJECTS[index % len(SUBJECTS)]
+            contact = int(self.rng.choice([0, 1, 2], p=[0.15, 0.73, 0.12]))
+            courses.append({'dept': "DF" + subject[:2].upper(), 'subject': subject,
+                            'number': str(100 + index // len(SUBJECTS)), 'contact': str(contact),
+                            'max': str(int(self.rng.choice([20, 24, 26]))), 'periods': contact})
+        popularity = 1 / np.arange(1, self.number_courses + 1) ** 0.9
+        popularity[self.rng.random(self.number_courses) < 0.1] = 0
+        self.rng.shuffle(popularity)
+        for course, weight in zip(courses, popularity / popularity.sum()):
+            course['name'] = course['subject'] + " " + course['number']
+            course['weight'] = weight
+
+        def fixed_course(dept, subject, number, contact, seats):
+            return {'dept': dept, 'subject': subject, 'number': number, 'contact': str(contact), 'max': str(seats),
+                    'periods': contact, 'name': subject + " " + number, 'weight': 0}
+
+        for suffix in "FWS":
+            courses.append(fixed_course("AD", "PhyEd", "700" + suffix, 1, 500))
+            for period in range(8):
+                courses.append(fixed_course("AD", "PhyEd", "71{}{}".format(period + 1, suffix), 1, 4000))
+        # as in the shipped catalog the requested course has no periods of its own,
+        # its demand only fires the rule that requests the trimester parts
+        for course_name in ARMNSHP_COURSES:
+            courses.append(fixed_course("306FTG", "ArmnShp", course_name.split()[1], 0, 999))
+            for suffix in "FWS":
+                courses.append(fixed_course("306FTG", "ArmnShp", course_name.split()[1] + suffix, 2, 35))
+        return courses
+
+    def generate_cadets(self, sports):
+        """Rows of Cadets.csv; about a third of the cadets are intercollegiate athletes"""
+        cadets = []
+        for index in range(self.number_cadets):
+            sport_code, sport_gender = "", ""
+            if self.rng.random() < 0.3:
+                sport_code, sport_gender = sports[self.rng.integers(len(sports))][:2]
+            cadets.append([str(30000 + index), str(2019 + self.rng.integers(5)), str(1 + self.rng.integers(40)),
+                           "No Major", "No Major", sport_code, sport_gender])
+        return cadets
+
+    def generate_demand(self, cadets, courses):
+        """Rows of Demand.csv; each cadet requests distinct courses by popularity"""
+        academic = [course for course in courses if course['weight'] > 0]
+        weights = np.array([course['weight'] for course in academic])
+        armnshp = {course['name']: course for course in courses}
+        demand = []
+        for cadet in cadets:
+            number_requests = int(np.clip(round(self.rng.normal(self.requests_per_cadet, 1.5)), 3,
+                                          min(len(academic), 2 * self.requests_per_cadet)))
+            requested = [academic[index] for index in
+                         self.rng.choice(len(academic), size=number_requests, replace=False, p=weights)]
+            # the oldest class requests the airmanship courses the rules expand by trimester
+            if cadet[1] == "2019" and self.rng.random() < 0.05:
+                requested.append(armnshp[ARMNSHP_COURSES[self.rng.integers(len(ARMNSHP_COURSES))]])
+            for course in requested:
+                period = PERIODS[self.rng.integers(8)]
+                demand.append([cadet[0], "Fall 2018" if self.rng.random() < 0.5 else "Spring 2018",
+                               course['name'], period + "A", "", period, course['subject'], course['number'],
+                               course['number'], "", course['name']])
+        return demand
+
+    def generate_offerings(self, courses, demand, cadets, sports):
+        """Rows of PCO.csv with seats sized from the generated demand"""
+        requested = {}
+        for row in demand:
+            requested[row[10]] = requested.get(row[10], 0) + 1
+        # PE requests are added per cadet once the inputs are loaded
+        practice = {(sport[0], sport[1]): (sport[2], sport[3]) for sport in sports}
+        athletes = {course_name: 0 for course_name in PE_IC_COURSES.values()}
+        for cadet in cadets:
+            if cadet[5]:
+                practice_m, practice_t = practice[(cadet[5], cadet[6])]
+                athletes[PE_IC_COURSES[('practice_m', practice_m)]] += 1
+                athletes[PE_IC_COURSES[('practice_t', practice_t)]] += 1
+        non_athletes = sum(1 for cadet in cadets if not cadet[5])
+
+        offerings = []
+        for course in courses:
+            name = course['name']
+            if name.startswith("PhyEd 700"):
+                # non-athletes take two of the three trimesters, any period
+                semester = SEMESTERS["FWS".index(name[-1])]
+                seats = math.ceil(2 / 3 * non_athletes * self.seat_slack / len(PERIODS))
+                offerings.extend(["AD", name, "1xx", semester, period, "1", str(seats)] for period in PERIODS)
+            elif name.startswith("PhyEd 71"):
+                # athletes' PE meets in the period of the course number
+                seats = math.ceil(athletes.get(name[:-1], 0) * self.seat_slack) + 1
+                offerings.append(["AD", name, "1", SEMESTERS["FWS".index(name[-1])],
+                                  PERIODS[int(name[-2]) - 1], "1", str(seats)])
+            elif name.startswith("ArmnShp") and course['periods'] > 0:
+                # the trimester parts, sized from the requests for their course
+                seats = math.ceil(requested.get(name[:-1], 0) * self.seat_slack / 2) + 1
+                offerings.extend(["306FTG", name, "2", SEMESTERS["FWS".index(name[-1])], period, "1", str(seats)]
+                                 for period in ["M3", "T3"])
+            elif course['periods'] > 0:
+                offerings.extend(self.generate_course_offerings(course, requested.get(name, 0)))
+        return offerings
+
+    def generate_course_offerings(self, course, number_requested):
+        """Spreads enough sections for the course's demand over distinct trimester/periods"""
+        section_seats = int(course['max'])
+        number_sections = max(1, math.ceil(number_requested * self.seat_slack / section_seats))
+        # double periods start on the first or third period of a day
+        starts = [0, 2, 4, 6] if course['periods'] == 2 else list(range(8))
+        slots = [(semester, period) for semester in range(3) for period in starts]
+        number_slots = min(len(slots), max(1, min(number_sections, int(self.rng.integers(2, 7)))))
+        sections = [number_sections // number_slots + (index < number_sections % number_slots)
+                    for index in range(number_slots)]
+        rows = []
+        for slot, number in zip(self.rng.choice(len(slots), size=number_slots, replace=False), sections):
+            semester, period = slots[slot]
+            rows.append([course['dept'], course['name'], course['contact'], SEMESTERS[semester], PERIODS[period],
+                         str(number), str(section_seats)])
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic scheduling inputs")
+    parser.add_argument("output_directory")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1x", help="size preset")
+    parser.add_argument("--cadets", type=int, default=None, help="number of cadets, overrides the preset")
+    parser.add_argument("--requests-per-cadet", type=int, default=None, help="overrides the preset")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generator = SyntheticData.from_scale(args.scale, args.seed)
+    if args.cadets is not None:
+        generator.number_cadets = args.cadets
+    if args.requests_per_cadet is not None:
+        generator.requests_per_cadet = args.requests_per_cadet
+    number_requests = generator.write(args.output_directory)
+    print("Wrote {} cadets and {} course requests to {}".format(
+        generator.number_cadets, number_requests, args.output_directory))
+
+
+if __name__ == "__main__":
+    main()